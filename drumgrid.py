@@ -0,0 +1,367 @@
+from array import array
+from collections import deque
+
+
+EMPTY = ord('-')
+HITS = b"oOxXgrRlL"
+DEFAULT_PITCHES = ("ride", "sn", "bd", "hf")
+
+
+class DrumGrid():
+
+    def __init__(
+        self,
+        pitches=DEFAULT_PITCHES,
+        measures: int = 1,
+        time: (int, int) = (4, 4),
+        subdivision: int = 16,
+    ) -> None:
+        beats, division = time
+        if subdivision % division:
+            raise ValueError(
+                "Subdivision {} is not a multiple of {}".format(
+                    subdivision, division))
+        self._pitches = tuple(pitches)
+        self._index = {pitch: i for i, pitch in enumerate(self._pitches)}
+        self._time = (beats, division)
+        self._subdivision = subdivision
+        self._beat_steps = subdivision // division
+        self._measure_steps = self._beat_steps * beats
+        self._measures = 0
+        self._rows = [bytearray() for _ in self._pitches]
+        self._dirty = set()
+        self.resize(measures)
+
+    @classmethod
+    def from_rows(
+        cls,
+        rows: dict,
+        time: (int, int) = (4, 4),
+        subdivision: int = 16,
+    ):
+        rows = {
+            pitch: (row.encode() if isinstance(row, str) else bytes(row))
+            for pitch, row in rows.items()
+        }
+        rows = {pitch: row.replace(b"|", b"") for pitch, row in rows.items()}
+        grid = cls(rows.keys(), measures=0, time=time, subdivision=subdivision)
+        steps = max([len(_) for _ in rows.values()] + [0])
+        grid.resize(-(-steps // grid.measure_steps))
+        for pitch, row in rows.items():
+            unknown = row.translate(None, HITS + bytes([EMPTY]))
+            if unknown:
+                raise ValueError("Unknow hit: {}".format(chr(unknown[0])))
+            grid.row(pitch)[:len(row)] = row
+        return grid
+
+    @property
+    def pitches(self) -> tuple:
+        return self._pitches
+
+    @property
+    def time(self) -> (int, int):
+        return self._time
+
+    @property
+    def subdivision(self) -> int:
+        return self._subdivision
+
+    @property
+    def beat_steps(self) -> int:
+        return self._beat_steps
+
+    @property
+    def measure_steps(self) -> int:
+        return self._measure_steps
+
+    @property
+    def measures(self) -> int:
+        return self._measures
+
+    @property
+    def steps(self) -> int:
+        return self._measures * self._measure_steps
+
+    def index(self, pitch) -> int:
+        if isinstance(pitch, int):
+            return pitch
+        try:
+            return self._index[pitch]
+        except KeyError:
+            raise ValueError("Unknow pitch: {}".format(pitch)) from None
+
+    def row(self, pitch) -> bytearray:
+        return self._rows[self.index(pitch)]
+
+    def resize(self, measures: int) -> None:
+        steps = measures * self._measure_steps
+        for row in self._rows:
+            if len(row) < steps:
+                row.extend(bytes([EMPTY]) * (steps - len(row)))
+            else:
+                del row[steps:]
+        self._dirty.update(range(self._measures, measures))
+        self._dirty.difference_update(range(measures, self._measures))
+        self._measures = measures
+
+    def copy(self):
+        grid = DrumGrid(
+            self._pitches,
+            measures=0,
+            time=self._time,
+            subdivision=self._subdivision,
+        )
+        grid._rows = [bytearray(_) for _ in self._rows]
+        grid._measures = self._measures
+        return grid
+
+    def ensure(self, measures: int) -> None:
+        if measures > self._measures:
+            self.resize(measures)
+
+    def get(self, pitch, step: int) -> int:
+        return self.row(pitch)[step]
+
+    def set(self, pitch, step: int, value: int) -> None:
+        if value != EMPTY and value not in HITS:
+            raise ValueError("Unknow hit: {}".format(chr(value)))
+        row = self.row(pitch)
+        if step >= len(row):
+            self.ensure(step // self._measure_steps + 1)
+        if row[step] != value:
+            row[step] = value
+            self._dirty.add(step // self._measure_steps)
+
+    def clear(self, pitch, step: int) -> None:
+        self.set(pitch, step, EMPTY)
+
+    def set_slice(self, pitch, start: int, values: bytes) -> None:
+        unknown = bytes(values).translate(None, HITS + bytes([EMPTY]))
+        if unknown:
+            raise ValueError("Unknow hit: {}".format(chr(unknown[0])))
+        row = self.row(pitch)
+        stop = start + len(values)
+        if stop > len(row):
+            self.ensure(-(-stop // self._measure_steps))
+        if row[start:stop] != values:
+            row[start:stop] = values
+            self._dirty.update(range(
+                start // self._measure_steps,
+                (stop - 1) // self._measure_steps + 1))
+
+    def block(self, pitches, start: int, stop: int) -> list:
+        # the rows of a rectangle of cells, padded past the last measure
+        width = stop - start
+        return [
+            bytes(self.row(pitch)[start:stop]).ljust(width, bytes([EMPTY]))
+            for pitch in pitches
+        ]
+
+    @property
+    def dirty(self) -> set:
+        return self._dirty
+
+    def pop_dirty(self) -> list:
+        measures = sorted(self._dirty)
+        self._dirty.clear()
+        return measures
+
+    def column(self, step: int) -> list:
+        return [
+            (pitch, row[step])
+            for pitch, row in zip(self._pitches, self._rows)
+            if row[step] != EMPTY
+        ]
+
+    def is_empty(self, step: int) -> bool:
+        for row in self._rows:
+            if row[step] != EMPTY:
+                return False
+        return True
+
+    def render(self, pitch, measure: int, count: int, sep: str = '|') -> str:
+        # measures past the last one render empty, the grid is not grown
+        row = self.row(pitch)
+        start = measure * self._measure_steps
+        stop = start + count * self._measure_steps
+        empty = chr(EMPTY)
+        result = ""
+        for i in range(start, stop, self._measure_steps):
+            notes = row[i:i+self._measure_steps].decode()
+            result = result + notes.ljust(self._measure_steps, empty) + sep
+        return result
+
+
+class GridHistory():
+
+    def __init__(
+        self,
+        grid: DrumGrid,
+        groups: int = 1000,
+        cells: int = 1 << 20,
+    ) -> None:
+        # undo groups are arrays of packed (step, pitch, old, new) deltas,
+        # 8 bytes a cell, with the measure counts before and after them;
+        # the oldest groups are dropped past either limit
+        self._grid = grid
+        self._groups = groups
+        self._cells = cells
+        self._undo = deque()
+        self._redo: list = []
+        self._size = 0
+        self._group = None
+        self._measures = 0
+        self._depth = 0
+
+    @staticmethod
+    def _pack(pitch: int, step: int, old: int, new: int) -> int:
+        return step << 24 | pitch << 16 | old << 8 | new
+
+    @staticmethod
+    def _unpack(delta: int) -> (int, int, int, int):
+        return (delta >> 16) & 0xFF, delta >> 24, \
+            (delta >> 8) & 0xFF, delta & 0xFF
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def can_undo(self) -> bool:
+        return bool(self._undo) or bool(self._group)
+
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+    def begin(self) -> None:
+        # edits until the matching end() are undone as one
+        self._depth = self._depth + 1
+        if self._group is None:
+            self._group = array("Q")
+            self._measures = self._grid.measures
+
+    def end(self) -> None:
+        if not self._depth:
+            return
+        self._depth = self._depth - 1
+        if not self._depth:
+            self._close()
+
+    def _close(self) -> None:
+        group = self._group
+        self._group = None
+        self._depth = 0
+        if group:
+            self._push((group, self._measures, self._grid.measures))
+
+    def _push(self, group: (array, int, int)) -> None:
+        self._undo.append(group)
+        self._size = self._size + len(group[0])
+        while len(self._undo) > 1 and (
+                len(self._undo) > self._groups or self._size > self._cells):
+            self._size = self._size - len(self._undo.popleft()[0])
+
+    def record(self, pitch, step: int, old: int, new: int,
+               measures: int = None) -> None:
+        # measures: the grid's measure count before the edit
+        self._extend(array("Q", [
+            self._pack(self._grid.index(pitch), step, old, new)]), measures)
+
+    def _extend(self, deltas: array, measures: int = None) -> None:
+        self._redo.clear()
+        if self._group is not None:
+            self._group.extend(deltas)
+        else:
+            if measures is None:
+                measures = self._grid.measures
+            self._push((deltas, measures, self._grid.measures))
+
+    def set_slice(self, pitch, start: int, values: bytes) -> bool:
+        # one slice assignment, and a delta for each cell that changed
+        pitch = self._grid.index(pitch)
+        row = self._grid.row(pitch)
+        old = bytes(row[start:start+len(values)])
+        old = old.ljust(len(values), bytes([EMPTY]))
+        if old == values:
+            return False
+        measures = self._grid.measures
+        self._grid.set_slice(pitch, start, values)
+        pack = self._pack
+        self._extend(array("Q", [
+            pack(pitch, start + i, a, b)
+            for i, (a, b) in enumerate(zip(old, values)) if a != b
+        ]), measures)
+        return True
+
+    def paste(self, rows: list, pitch, step: int) -> None:
+        pitch = self._grid.index(pitch)
+        self.begin()
+        for row, values in enumerate(rows[:len(self._grid.pitches)-pitch]):
+            self.set_slice(pitch + row, step, values)
+        self.end()
+
+    def fill(self, pitches, start: int, stop: int, value: int) -> None:
+        self.paste([bytes([value]) * (stop - start)] * len(pitches),
+                   pitches[0], start)
+
+    def repeat(self, pitches, start: int, stop: int, count: int) -> None:
+        # count copies of the block right after it
+        rows = self._grid.block(pitches, start, stop)
+        self.paste([_ * count for _ in rows], pitches[0], stop)
+
+    def shift(self, pitches, start: int, stop: int, steps: int) -> None:
+        # moves the block's hits by steps, inside the block
+        width = stop - start
+        steps = max(-width, min(width, steps))
+        rows = self._grid.block(pitches, start, stop)
+        empty = bytes([EMPTY]) * abs(steps)
+        if steps >= 0:
+            rows = [empty + _[:width-steps] for _ in rows]
+        else:
+            rows = [_[-steps:] + empty for _ in rows]
+        self.paste(rows, pitches[0], start)
+
+    def set(self, pitch, step: int, value: int) -> bool:
+        pitch = self._grid.index(pitch)
+        row = self._grid.row(pitch)
+        old = row[step] if step < len(row) else EMPTY
+        if old == value:
+            return False
+        measures = self._grid.measures
+        self._grid.set(pitch, step, value)
+        self.record(pitch, step, old, value, measures)
+        return True
+
+    def undo(self) -> list:
+        # [(pitch, step)] of the cells restored, latest edit first
+        if self._group is not None:
+            self._close()
+        if not self._undo:
+            return []
+        group = self._undo.pop()
+        deltas, before, after = group
+        self._size = self._size - len(deltas)
+        changed = []
+        for delta in reversed(deltas):
+            pitch, step, old, new = self._unpack(delta)
+            self._grid.set(pitch, step, old)
+            changed.append((pitch, step))
+        # measures the edit grew go too: an undone repeat past the end
+        # leaves no empty measures behind
+        if before < after == self._grid.measures:
+            self._grid.resize(before)
+        self._redo.append(group)
+        return changed
+
+    def redo(self) -> list:
+        if not self._redo:
+            return []
+        group = self._redo.pop()
+        deltas, before, after = group
+        changed = []
+        for delta in deltas:
+            pitch, step, old, new = self._unpack(delta)
+            self._grid.set(pitch, step, new)
+            changed.append((pitch, step))
+        self._grid.ensure(after)
+        self._push(group)
+        return changed
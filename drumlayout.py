@@ -0,0 +1,67 @@
+import hashlib
+import os
+
+
+LAYOUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "layout")
+# in include order: rests and kit before the \layout block using them
+LAYOUT_FILES = ("drumrests.ly", "drumkit.ly", "layout.ly")
+
+
+class LayoutResources():
+
+    def __init__(self, directory: str = LAYOUT_DIR) -> None:
+        self._directory = directory
+        self._files: dict = {}
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    def path(self, name: str) -> str:
+        return os.path.join(self._directory, name)
+
+    def paths(self, names=LAYOUT_FILES) -> list:
+        return [self.path(_) for _ in names]
+
+    def _load(self, name: str) -> tuple:
+        # reloads only when the file's mtime or size changed
+        path = self.path(name)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = self._files.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached
+        with open(path, "rb") as layout_file:
+            data = layout_file.read()
+        cached = (stamp, data.decode(), hashlib.sha256(data).digest())
+        self._files[path] = cached
+        return cached
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+    def text(self, name: str) -> str:
+        return self._load(name)[1]
+
+    def digest(self, name: str) -> bytes:
+        return self._load(name)[2]
+
+    def texts(self, names=LAYOUT_FILES) -> list:
+        return [self.text(_) for _ in names]
+
+    def includes(self, names=LAYOUT_FILES) -> list:
+        paths = [self.path(_).replace(os.sep, "/") for _ in names]
+        return [rf'\include "{_}"' for _ in paths]
+
+    def clear(self) -> None:
+        self._files.clear()
+
+
+_layout_resources = None
+
+
+def layout_resources() -> LayoutResources:
+    global _layout_resources
+    if _layout_resources is None:
+        _layout_resources = LayoutResources()
+    return _layout_resources
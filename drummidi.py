@@ -0,0 +1,218 @@
+import itertools
+import struct
+
+
+PPQ = 480
+DRUM_CHANNEL = 9
+VELOCITY = 90
+ACCENT_VELOCITY = 115
+GHOST_VELOCITY = 45
+
+# General MIDI percussion key map, by canonical drum pitch name: LilyPond's
+# midiDrumPitches, plus the kit names from layout/drumkit.ly
+_gm_drum_notes = {
+    "acousticbassdrum": 35, "bassdrum": 36, "hisidestick": 37,
+    "sidestick": 37, "losidestick": 37, "acousticsnare": 38, "snare": 38,
+    "handclap": 39, "electricsnare": 40, "lowfloortom": 41,
+    "closedhihat": 42, "hihat": 42, "highfloortom": 43, "pedalhihat": 44,
+    "lowtom": 45, "openhihat": 46, "halfopenhihat": 46, "lowmidtom": 47,
+    "himidtom": 48, "crashcymbala": 49, "crashcymbal": 49, "hightom": 50,
+    "ridecymbala": 51, "ridecymbal": 51, "chinesecymbal": 52,
+    "ridebell": 53, "tambourine": 54, "splashcymbal": 55, "cowbell": 56,
+    "crashcymbalb": 57, "vibraslap": 58, "ridecymbalb": 59,
+    "mutehibongo": 60, "hibongo": 60, "openhibongo": 60,
+    "mutelobongo": 61, "lobongo": 61, "openlobongo": 61,
+    "mutehiconga": 62, "muteloconga": 62, "openhiconga": 63,
+    "hiconga": 63, "openloconga": 64, "loconga": 64, "hitimbale": 65,
+    "lotimbale": 66, "hiagogo": 67, "loagogo": 68, "cabasa": 69,
+    "maracas": 70, "shortwhistle": 71, "longwhistle": 72,
+    "shortguiro": 73, "longguiro": 74, "guiro": 74, "claves": 75,
+    "hiwoodblock": 76, "lowoodblock": 77, "mutecuica": 78,
+    "opencuica": 79, "mutetriangle": 80, "triangle": 81,
+    "opentriangle": 81, "tamtam": 52,
+    "footpedal": 44, "kick": 36, "kicka": 36, "kickb": 35, "kickc": 35,
+    "floortom": 43, "floortoma": 43, "floortomb": 41, "floortomc": 41,
+    "floortomd": 41, "snarea": 38, "snareb": 40, "snarec": 37,
+    "snared": 38, "snaree": 40, "midtom": 47, "midtoma": 47,
+    "midtomb": 45, "midtomc": 45, "midtomd": 45, "hightoma": 50,
+    "hightomb": 48, "hightomc": 48, "hightomd": 48, "ride": 51,
+    "ridea": 51, "rideb": 53, "ridec": 59, "hihata": 42, "hihatb": 46,
+    "hihatc": 46, "hihatd": 42, "hihate": 42, "hihatf": 44,
+    "hihatopen": 46, "crash": 49, "crasha": 49, "crashb": 57,
+}
+
+
+def gm_note(pitch) -> int:
+    from drumscore import drum_pitch
+    pitch = drum_pitch(pitch)
+    note = _gm_drum_notes.get(pitch)
+    if note is None:
+        raise ValueError(f"{pitch!r} has no General MIDI note.")
+    return note
+
+
+def _leaf_velocity(leaf) -> int:
+    for wrapper in leaf._wrappers:
+        name = getattr(wrapper.indicator, "name", None)
+        if name in ("accent", ">", "marcato", "^"):
+            return ACCENT_VELOCITY
+    return VELOCITY
+
+
+def _leaf_notes(leaf, notes: dict) -> list:
+    # [(note, velocity)] of a leaf; ghost notes are parenthesized heads
+    note_heads = getattr(leaf, "note_heads", None)
+    if note_heads is None:
+        note_head = getattr(leaf, "note_head", None)
+        note_heads = [] if note_head is None else [note_head]
+    result = []
+    velocity = None
+    for note_head in note_heads:
+        pitch = note_head.written_pitch
+        note = notes.get(pitch)
+        if note is None:
+            note = gm_note(pitch)
+            notes[pitch] = note
+        if note_head.is_parenthesized:
+            result.append((note, GHOST_VELOCITY))
+            continue
+        if velocity is None:
+            velocity = _leaf_velocity(leaf)
+        result.append((note, velocity))
+    return result
+
+
+class _EventBuilder():
+
+    def __init__(self) -> None:
+        self.events: list = []
+        self._ticks: dict = {}
+        self._notes: dict = {}
+
+    def _duration_ticks(self, leaf, scale) -> int:
+        # one Fraction multiplication per distinct duration, not per leaf
+        key = (leaf.written_duration, leaf.multiplier, scale)
+        ticks = self._ticks.get(key)
+        if ticks is None:
+            duration = leaf.written_duration * scale
+            if leaf.multiplier is not None:
+                duration = duration * leaf.multiplier
+            ticks = round(duration * 4 * PPQ)
+            self._ticks[key] = ticks
+        return ticks
+
+    def _flush(self, leaves: list, durations: list, start: int) -> int:
+        onsets = list(itertools.accumulate(durations, initial=start))
+        events = self.events
+        for leaf, onset, stop in zip(leaves, onsets, onsets[1:]):
+            for note, velocity in _leaf_notes(leaf, self._notes):
+                events.append((onset, 1, note, velocity))
+                events.append((stop, 0, note, 0))
+        return onsets[-1]
+
+    def add(self, component, start: int = 0, scale=1) -> int:
+        import abjad
+        from drumscore import DrumRepeat
+        if isinstance(component, abjad.Leaf):
+            return self._flush([component], [
+                self._duration_ticks(component, scale)], start)
+        if isinstance(component, abjad.Tuplet):
+            scale = scale * component.multiplier
+        if isinstance(component, DrumRepeat):
+            for _ in range(component.count):
+                start = self.add_contents(component, start, scale)
+            return start
+        return self.add_contents(component, start, scale)
+
+    def add_contents(self, container, start: int, scale) -> int:
+        import abjad
+        if container.simultaneous:
+            stops = [start]
+            for component in container:
+                stops.append(self.add(component, start, scale))
+            return max(stops)
+        # onsets of each run of leaves in one accumulate over integer ticks
+        leaves, durations = [], []
+        for component in container:
+            if isinstance(component, abjad.Leaf):
+                leaves.append(component)
+                durations.append(self._duration_ticks(component, scale))
+                continue
+            if leaves:
+                start = self._flush(leaves, durations, start)
+                leaves, durations = [], []
+            start = self.add(component, start, scale)
+        if leaves:
+            start = self._flush(leaves, durations, start)
+        return start
+
+
+def _time_signature(component) -> (int, int):
+    import abjad
+    for leaf in abjad.iterate.leaves(component):
+        for wrapper in leaf._wrappers:
+            if isinstance(wrapper.indicator, abjad.TimeSignature):
+                return wrapper.indicator.pair
+        break
+    return (4, 4)
+
+
+def _vlq(value: int) -> bytes:
+    result = [value & 0x7F]
+    value >>= 7
+    while value:
+        result.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(result))
+
+
+def midi_events(component) -> list:
+    # sorted (tick, on, note, velocity); offs sort before ons at a tick
+    builder = _EventBuilder()
+    builder.add(component)
+    builder.events.sort()
+    return builder.events
+
+
+def hit_velocity(value: int) -> int:
+    # DrumGrid hits: upper case accents, 'g' ghosts
+    if value == ord('g'):
+        return GHOST_VELOCITY
+    if chr(value).isupper():
+        return ACCENT_VELOCITY
+    return VELOCITY
+
+
+def smf_bytes(events, tempo: int = 120, time: (int, int) = (4, 4)) -> bytes:
+    # format 0 file of sorted (tick, on, note, velocity) drum events
+    beats, division = time
+    track = bytearray()
+    track += b"\x00\xff\x51\x03" + (60000000 // tempo).to_bytes(3, "big")
+    track += bytes([0, 0xFF, 0x58, 4, beats, division.bit_length() - 1,
+                    24, 8])
+    note_on = 0x90 | DRUM_CHANNEL
+    note_off = 0x80 | DRUM_CHANNEL
+    vlqs: dict = {}
+    tick = 0
+    for onset, on, note, velocity in events:
+        delta = onset - tick
+        vlq = vlqs.get(delta)
+        if vlq is None:
+            vlq = _vlq(delta)
+            vlqs[delta] = vlq
+        track += vlq
+        track += bytes((note_on if on else note_off, note, velocity))
+        tick = onset
+    track += b"\x00\xff\x2f\x00"
+    header = b"MThd" + struct.pack(">IHHH", 6, 0, 1, PPQ)
+    return header + b"MTrk" + struct.pack(">I", len(track)) + bytes(track)
+
+
+def midi_bytes(component, tempo: int = 120) -> bytes:
+    return smf_bytes(
+        midi_events(component), tempo, _time_signature(component))
+
+
+def write_midi(component, path: str, tempo: int = 120) -> None:
+    with open(path, "wb") as midi_file:
+        midi_file.write(midi_bytes(component, tempo))
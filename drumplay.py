@@ -0,0 +1,209 @@
+import sys
+import threading
+import time
+
+from drumgrid import DrumGrid
+
+
+# the last SPIN seconds before a step are busy-waited: sleeping wakes up
+# late by the scheduler's granularity, spinning does not
+SPIN = 0.002
+
+
+class JitterStats():
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.dropped = 0
+
+    def add(self, lateness: float) -> None:
+        self.count = self.count + 1
+        self.total = self.total + lateness
+        if lateness > self.max:
+            self.max = lateness
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def __str__(self) -> str:
+        return "jitter: mean {:.3f} ms, max {:.3f} ms, {} steps, " \
+            "{} dropped".format(
+                self.mean * 1000, self.max * 1000, self.count, self.dropped)
+
+
+class NullSink():
+
+    # no output and no state: can be played again after close()
+    def play(self, step: int, notes: list, seconds: float) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class RecordSink():
+
+    def __init__(self) -> None:
+        self.events: list = []
+        self.closed = False
+
+    def play(self, step: int, notes: list, seconds: float) -> None:
+        for note, velocity in notes:
+            self.events.append((seconds, step, note, velocity))
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class StdoutSink():
+
+    def __init__(self, fp=sys.stdout) -> None:
+        self._fp = fp
+
+    def play(self, step: int, notes: list, seconds: float) -> None:
+        for note, velocity in notes:
+            self._fp.write("{:.3f} {} {} {}\n".format(
+                seconds, step, note, velocity))
+        self._fp.flush()
+
+    def close(self) -> None:
+        pass
+
+
+class MidiFileSink():
+
+    def __init__(
+        self,
+        path: str,
+        tempo: int = 120,
+        time: (int, int) = (4, 4),
+    ) -> None:
+        self._path = path
+        self._tempo = tempo
+        self._time = time
+        self._events: list = []
+
+    def play(self, step: int, notes: list, seconds: float) -> None:
+        from drummidi import PPQ
+        # scheduled times, not the measured ones: the file has no jitter
+        tick = round(seconds * self._tempo * PPQ / 60)
+        for note, velocity in notes:
+            self._events.append((tick, 1, note, velocity))
+            self._events.append((tick + PPQ // 8, 0, note, 0))
+
+    def close(self) -> None:
+        from drummidi import smf_bytes
+        self._events.sort()
+        with open(self._path, "wb") as midi_file:
+            midi_file.write(smf_bytes(self._events, self._tempo, self._time))
+
+
+class Player():
+
+    def __init__(
+        self,
+        grid: DrumGrid,
+        sink,
+        tempo: int = 120,
+        loop: bool = False,
+        clock=time.monotonic,
+    ) -> None:
+        self._grid = grid
+        self._sink = sink
+        self._tempo = tempo
+        self._loop = loop
+        self._clock = clock
+        self._stop = threading.Event()
+        self._thread = None
+        self._notes = None
+        self.position = None
+        self.jitter = JitterStats()
+
+    @property
+    def step_seconds(self) -> float:
+        return 60 / self._tempo / self._grid.beat_steps
+
+    @property
+    def playing(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _load_notes(self) -> dict:
+        from drummidi import gm_note
+        return {pitch: gm_note(pitch) for pitch in self._grid.pitches}
+
+    def _play_step(self, step: int, seconds: float) -> None:
+        from drummidi import hit_velocity
+        notes = [
+            (self._notes[pitch], hit_velocity(value))
+            for pitch, value in self._grid.column(step)
+        ]
+        if notes:
+            self._sink.play(step, notes, seconds)
+
+    def _wait(self, deadline: float) -> bool:
+        delay = deadline - self._clock() - SPIN
+        if delay > 0 and self._stop.wait(delay):
+            return False
+        while self._clock() < deadline:
+            if self._stop.is_set():
+                return False
+        return True
+
+    def run(self) -> None:
+        # every deadline is start + n * step: a late step never delays
+        # the next ones, and steps later than a whole step are dropped
+        if self._notes is None:
+            self._notes = self._load_notes()
+        step_seconds = self.step_seconds
+        start = self._clock()
+        tick = 0
+        step = 0
+        try:
+            while not self._stop.is_set():
+                if step >= self._grid.steps:
+                    if not self._loop or not self._grid.steps:
+                        break
+                    # dropped steps may run past the end: keep their place
+                    step = step % self._grid.steps
+                deadline = start + tick * step_seconds
+                if not self._wait(deadline):
+                    break
+                lateness = self._clock() - deadline
+                if lateness >= step_seconds:
+                    missed = int(lateness // step_seconds)
+                    self.jitter.dropped = self.jitter.dropped + missed
+                    tick = tick + missed
+                    step = step + missed
+                    continue
+                self.jitter.add(lateness)
+                self.position = step
+                self._play_step(step, tick * step_seconds)
+                tick = tick + 1
+                step = step + 1
+        finally:
+            self.position = None
+            self._sink.close()
+
+    def start(self) -> None:
+        if self.playing:
+            return
+        # gm_note() loads the score model: do it before the clock starts
+        if self._notes is None:
+            self._notes = self._load_notes()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self.run, name="drumpond-player", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def wait(self) -> None:
+        if self._thread is not None:
+            self._thread.join()
@@ -1,8 +1,17 @@
+import asyncio
 import inspect
 import curses
+import json
+import os
+import sys
+import time
 
+from collections import deque
 from curses import window
 from enum import Enum, auto
+from drumgrid import DrumGrid, GridHistory, EMPTY, HITS
+from drumplay import NullSink, Player
+from drumtab import tab_rows
 
 
 class InputMode(Enum):
@@ -32,12 +41,289 @@ class Events(Enum):
     PLAYBACK = auto()
     COMMAND_SEND = auto()
     DRUMTAB_READY = auto()
+    CELL_EDIT = auto()
+    PLAYHEAD = auto()
+    INFO = auto()
+    UNDO = auto()
+    REDO = auto()
+    PASTE = auto()
+
+
+def _changed_span(old: str, new: str) -> (int, int):
+    # [start, stop) of the cells of new that differ from old
+    if old == new:
+        return None
+    start = 0
+    while old[start] == new[start]:
+        start = start + 1
+    stop = len(new)
+    while old[stop-1] == new[stop-1]:
+        stop = stop - 1
+    return start, stop
+
+
+class Screen():
+
+    def __init__(self, stdscr: window) -> None:
+        # a shadow copy of what was written: rewriting unchanged cells is
+        # skipped, and changed lines wait for one flush() per frame
+        self._stdscr = stdscr
+        self._h, self._w = stdscr.getmaxyx()
+        self._lines = [" " * self._w for _ in range(self._h)]
+        self._dirty = set()
+        self._yx = (0, 0)
+        self._flushed_yx = None
+        self.updates = 0
+        # keys are read from a window that is never drawn: getch() on
+        # stdscr would refresh it in the middle of a frame
+        self._input = curses.newwin(1, 1, 0, 0)
+        self._input.keypad(True)
+        self._input.noutrefresh()
+        self._stdscr.idlok(True)
+
+    def __getattr__(self, name: str):
+        return getattr(self._stdscr, name)
+
+    @property
+    def dirty(self) -> set:
+        return self._dirty
+
+    def getmaxyx(self) -> (int, int):
+        return self._h, self._w
+
+    def getch(self) -> int:
+        return self._input.getch()
+
+    def nodelay(self, flag: bool) -> None:
+        self._input.nodelay(flag)
+
+    def timeout(self, delay: int) -> None:
+        self._input.timeout(delay)
+
+    def addstr(self, y: int, x: int, string: str, *attr) -> None:
+        line = self._lines[y]
+        string = string[:self._w - x]
+        span = _changed_span(line[x:x+len(string)], string)
+        if span is None and not attr:
+            return
+        start, stop = (0, len(string)) if span is None else span
+        self._stdscr.addstr(y, x + start, string[start:stop], *attr)
+        self._lines[y] = line[:x+start] + string[start:stop] + line[x+stop:]
+        self._dirty.add(y)
+
+    def addch(self, y: int, x: int, ch: int) -> None:
+        self.addstr(y, x, chr(ch))
+
+    def chgat(self, y: int, x: int, num: int, attr: int) -> None:
+        self._stdscr.chgat(y, x, num, attr)
+        self._dirty.add(y)
+
+    def move(self, y: int, x: int) -> None:
+        self._yx = (y, x)
+
+    def clear(self) -> None:
+        self._stdscr.clear()
+        self._lines = [" " * self._w for _ in range(self._h)]
+        self._dirty.update(range(self._h))
+
+    def scroll(self, top: int, bottom: int, lines: int) -> None:
+        # shifts lines top..bottom up, down when negative, with the
+        # terminal's own scrolling (idlok) rather than rewriting them
+        self._stdscr.scrollok(True)
+        self._stdscr.setscrreg(top, bottom)
+        self._stdscr.scroll(lines)
+        self._stdscr.setscrreg(0, self._h - 1)
+        self._stdscr.scrollok(False)
+        blank = " " * self._w
+        region = self._lines[top:bottom+1]
+        if lines > 0:
+            region = region[lines:] + [blank] * lines
+        else:
+            region = [blank] * -lines + region[:lines]
+        self._lines[top:bottom+1] = region
+        self._dirty.update(range(top, bottom + 1))
+
+    def flush(self) -> bool:
+        # one doupdate for everything drawn since the last flush
+        if not self._dirty and self._yx == self._flushed_yx:
+            return False
+        self._stdscr.move(*self._yx)
+        self._stdscr.noutrefresh()
+        curses.doupdate()
+        self._dirty.clear()
+        self._flushed_yx = self._yx
+        self.updates = self.updates + 1
+        return True
+
+    refresh = flush
+
+
+# set to a path to record event statistics from startup, dumped there
+STATS_PATH = os.environ.get("DRUMPOND_STATS")
+STATS_DEFAULT_PATH = "drumpond-stats.json"
+# handler wall-time histogram: bucket i counts times under 2**i us
+STATS_BUCKETS = 24
+
+
+class EventStats():
+
+    def __init__(self) -> None:
+        self.counts: dict = {}
+        self.fanout: dict = {}
+        self.coalesced: dict = {}
+        # "subscriber.EVENT": [calls, seconds, max seconds, histogram]
+        self.handlers: dict = {}
+
+    def posted(self, event: Events, fanout: int) -> None:
+        name = event.name
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.fanout[name] = self.fanout.get(name, 0) + fanout
+
+    def merged(self, event: Events) -> None:
+        name = event.name
+        self.coalesced[name] = self.coalesced.get(name, 0) + 1
+
+    def handled(self, subscriber: str, event: Events, seconds: float) -> None:
+        key = "{}.{}".format(subscriber, event.name)
+        handler = self.handlers.get(key)
+        if handler is None:
+            handler = [0, 0.0, 0.0, [0] * STATS_BUCKETS]
+            self.handlers[key] = handler
+        handler[0] = handler[0] + 1
+        handler[1] = handler[1] + seconds
+        if seconds > handler[2]:
+            handler[2] = seconds
+        bucket = min(int(seconds * 1000000).bit_length(), STATS_BUCKETS - 1)
+        handler[3][bucket] = handler[3][bucket] + 1
+
+    def summary(self, count: int = 3) -> str:
+        # total dispatches and the handlers taking the most time
+        slowest = sorted(
+            self.handlers.items(), key=lambda _: _[1][1], reverse=True)
+        handlers = ", ".join(
+            "{} {:.1f}ms/{}".format(key, handler[1] * 1000, handler[0])
+            for key, handler in slowest[:count]
+        )
+        return "{} events, {} handled: {}".format(
+            sum(self.counts.values()),
+            sum(_[0] for _ in self.handlers.values()),
+            handlers or "-",
+        )
+
+    def as_dict(self) -> dict:
+        events = {
+            name: {
+                "count": count,
+                "fanout": self.fanout[name] / count,
+                "coalesced": self.coalesced.get(name, 0),
+            }
+            for name, count in sorted(self.counts.items())
+        }
+        handlers = {
+            key: {
+                "calls": calls,
+                "total_ms": seconds * 1000,
+                "mean_us": seconds * 1000000 / calls,
+                "max_us": longest * 1000000,
+                "histogram_us": {
+                    "<{}".format(2 ** i): n
+                    for i, n in enumerate(histogram) if n
+                },
+            }
+            for key, (calls, seconds, longest, histogram)
+            in sorted(self.handlers.items())
+        }
+        return {"events": events, "handlers": handlers}
+
+    def dump(self, path: str) -> None:
+        with open(path, "w") as stats_file:
+            json.dump(self.as_dict(), stats_file, indent=2)
+
+
+class EventBus():
+
+    def __init__(self) -> None:
+        # [subscriber, event, message] entries, delivered in post order
+        self._queue = deque()
+        # the queued entry of each (subscriber, event) that coalesces
+        self._pending: dict = {}
+        self._draining = False
+        # an EventStats while instrumented: a single check when not
+        self.stats = None
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def post(self, subscribers, event: Events, message) -> None:
+        stats = self.stats
+        if stats is not None:
+            stats.posted(event, len(subscribers))
+        for subscriber in subscribers:
+            if event not in subscriber._coalesce:
+                self._queue.append([subscriber, event, message])
+                continue
+            # still queued: the subscriber only gets the latest message
+            entry = self._pending.get((subscriber, event))
+            if entry is not None:
+                entry[2] = message
+                if stats is not None:
+                    stats.merged(event)
+                continue
+            entry = [subscriber, event, message]
+            self._pending[(subscriber, event)] = entry
+            self._queue.append(entry)
+
+    def drain(self, coalesced: bool = True) -> int:
+        # handlers post rather than call each other: events posted while
+        # draining are delivered by this same drain, never recursively;
+        # with coalesced False, coalesced events stay queued and keep
+        # merging until a full drain
+        if self._draining:
+            return 0
+        self._draining = True
+        count = 0
+        held = []
+        try:
+            while self._queue:
+                entry = self._queue.popleft()
+                subscriber, event, message = entry
+                if self._pending.get((subscriber, event)) is entry:
+                    if not coalesced:
+                        held.append(entry)
+                        continue
+                    del self._pending[(subscriber, event)]
+                action = subscriber._events_action[event.value]
+                # read once: ':stats' itself turns stats on and off
+                stats = self.stats
+                if stats is None:
+                    action(message)
+                else:
+                    start = time.perf_counter()
+                    action(message)
+                    stats.handled(
+                        subscriber.name, event, time.perf_counter() - start)
+                count = count + 1
+        finally:
+            self._queue.extendleft(reversed(held))
+            self._draining = False
+        return count
+
+
+_bus = EventBus()
 
 
 class Component():
 
-    def __init__(self, name: str, stdscr: window) -> None:
+    def __init__(
+        self,
+        name: str,
+        stdscr: window,
+        bus: EventBus = None,
+    ) -> None:
         self._name = name
+        self._bus = _bus if bus is None else bus
+        # events only the last of which per drain matters to this one
+        self._coalesce = set()
         self._stdscr = stdscr
         self._screen_h, self._screen_w = stdscr.getmaxyx()
         self._mode: InputMode = InputMode.WAIT
@@ -60,6 +346,10 @@ class Component():
     def events(self) -> dict:
         return self._events
 
+    @property
+    def bus(self) -> EventBus:
+        return self._bus
+
     @property
     def screen_size(self) -> (int, int):
         return self._screen_h-1, self._screen_w-1
@@ -104,8 +394,7 @@ class Component():
         self.get_subscribers(event).remove(who)
 
     def dispatch(self, event: str, message):
-        for subscriber in self.get_subscribers(event):
-            subscriber._events_action[event.value](message)
+        self._bus.post(self.get_subscribers(event), event, message)
 
     def _on_esc_keypress(self, dummy) -> bool:
         if self._mode == InputMode.WAIT:
@@ -123,12 +412,21 @@ class Component():
         return False
 
 
+# bracketed paste: the terminal wraps pasted text in these
+PASTE_START = "\x1b[200~"
+PASTE_END = "\x1b[201~"
+# ms to wait for the rest of a paste the terminal sends in pieces
+PASTE_TIMEOUT = 100
+
+
 class KInput(Component):
 
     def __init__(self, stdscr: window) -> None:
         super().__init__("kinput", stdscr)
         self._stdscr = stdscr
         self._k = 0
+        # keys read ahead while looking for a paste, in order
+        self._pending = deque()
         self._actions: list = [None] * curses.KEY_MAX
         self._actions[curses.KEY_LEFT] = (Events.K_LEFT, curses.KEY_LEFT)
         self._actions[curses.KEY_UP] = (Events.K_UP, curses.KEY_UP)
@@ -142,9 +440,55 @@ class KInput(Component):
         self._actions[ord('i')] = (Events.INSERT, InputMode.INSERT)
         self._actions[ord('v')] = (Events.VISUAL, InputMode.VISUAL)
         self._actions[ord('p')] = (Events.PLAYBACK, InputMode.PLAYBACK)
+        self._actions[ord('u')] = (Events.UNDO, None)
+        # ctrl-r
+        self._actions[18] = (Events.REDO, None)
+
+    def _getch(self) -> int:
+        if self._pending:
+            return self._pending.popleft()
+        return self._stdscr.getch()
+
+    def _starts_paste(self) -> bool:
+        # after an ESC: are the keys already waiting the paste start?
+        start = [ord(_) for _ in PASTE_START[1:]]
+        while len(self._pending) < len(start):
+            k = self._stdscr.getch()
+            if k == -1:
+                break
+            self._pending.append(k)
+            if list(self._pending) != start[:len(self._pending)]:
+                return False
+        if list(self._pending) != start:
+            return False
+        self._pending.clear()
+        return True
+
+    def _read_paste(self) -> str:
+        end = [ord(_) for _ in PASTE_END]
+        keys = []
+        self._stdscr.timeout(PASTE_TIMEOUT)
+        try:
+            while keys[-len(end):] != end:
+                k = self._stdscr.getch()
+                if k == -1:
+                    break
+                keys.append(k)
+        finally:
+            self._stdscr.nodelay(True)
+        if keys[-len(end):] == end:
+            del keys[-len(end):]
+        return bytes(_ for _ in keys if _ < 256).decode("utf-8", "replace")
 
     def listen(self) -> bool:
-        self._k = self._stdscr.getch()
+        self._k = self._getch()
+        # no key waiting, see run()
+        if self._k == -1:
+            return False
+        # a paste is one event, not a key per character
+        if self._k == 27 and self._starts_paste():
+            self.dispatch(Events.PASTE, self._read_paste())
+            return True
         # 0-9
         if self._k >= 48 and self._k <= 57:
             self.dispatch(Events.K_PRESS, self._k)
@@ -159,6 +503,7 @@ class KInput(Component):
         if self._actions[self._k] is not None:
             self.dispatch(self._actions[self._k][0],
                           self._actions[self._k][1])
+        return True
 
 
 class Row(Component):
@@ -177,14 +522,15 @@ class Row(Component):
         content_l: str = "",
         content_r: str = "",
     ) -> None:
-        self._content_l = str(content_l)
         self._content_r = str(content_r)
+        # long messages are cut, the right side content stays in place
+        self._content_l = str(content_l)[
+            :max(self._length - len(self._content_r), 0)]
         cl_len = len(self._content_l)
         cr_len = len(self._content_r)
         blank_space = " " * (self._length - cl_len - cr_len)
         self._content = self._content_l + blank_space + self._content_r
         self._stdscr.addstr(y, x, self._content)
-        self._stdscr.noutrefresh()
 
 
 class Header(Row):
@@ -220,6 +566,8 @@ class StatusBar(Row):
         self._events_action[Events.INSERT.value] = self._on_insert
         self._events_action[Events.VISUAL.value] = self._on_visual
         self._events_action[Events.PLAYBACK.value] = self._on_playback
+        self._events_action[Events.INFO.value] = self._on_info
+        self._coalesce.add(Events.CURSOR_MOVE)
 
     @property
     def info(self) -> str:
@@ -261,14 +609,56 @@ class StatusBar(Row):
     def _on_playback(self, dummy) -> None:
         self._on_mode_change(InputMode.PLAYBACK)
 
+    def _on_info(self, info: str) -> None:
+        self.info = info
+
+
+class Jobs():
+
+    def __init__(self) -> None:
+        # one worker: jobs run in order, and own what they touch
+        self._executor = None
+
+    def submit(self, job, done) -> None:
+        # runs job() off the main loop, then done(result, error) on it
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None:
+            try:
+                result = job()
+            except Exception as error:
+                done(None, error)
+            else:
+                done(result, None)
+            return
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(
+                1, thread_name_prefix="drumpond-job")
+        future = loop.run_in_executor(self._executor, job)
+
+        def on_done(future) -> None:
+            error = future.exception()
+            done(None if error else future.result(), error)
+
+        future.add_done_callback(on_done)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
 
 class Commands(Component):
 
-    def __init__(self, stdscr):
+    def __init__(self, stdscr, grid: DrumGrid, jobs: Jobs = None):
         super().__init__("commands", stdscr)
-        self.ymin = self.xmin = self.ymax = self.xmax = 0
-        self._events_action[Events.DRUMTAB_READY.value] \
-            = self._on_drumtab_ready
+        self._grid = grid
+        self._jobs = Jobs() if jobs is None else jobs
+        self._path = "drumpond.ly"
+        self._dscore = None
         self.commands = {}
         for element in inspect.getmembers(
                 self, predicate=inspect.ismethod):
@@ -279,21 +669,50 @@ class Commands(Component):
 
     q = quit
 
+    def _export(self, grid: DrumGrid, measures: list, path: str) -> str:
+        # abjad is slow to import: load it on the first save only
+        import drumpond
+        # later saves rebuild and re-format the edited measures only
+        if self._dscore is None:
+            self._dscore = drumpond.DrumScore.from_grid(grid)
+        else:
+            self._dscore.update_from_grid(grid, measures)
+        drumpond.write_lilypond_file(self._dscore, path)
+        return path
+
+    def _on_export(self, path: str, error, measures: list = ()) -> None:
+        if error is not None:
+            # not exported: the next write rebuilds these measures again
+            self._grid.dirty.update(measures)
+            self.dispatch(Events.INFO, "write: {}".format(error))
+        else:
+            self.dispatch(Events.INFO, "written {}".format(path))
+
     def write(self, arg=None) -> None:
-        row = self.ymin
-        while row <= self.ymax - 1:
-            col = self.xmin
-            while col < self.xmax - 1:
-                if self._stdscr.inch(row, col) == ord('o'):
-                    self._stdscr.addch(row, col, ord('#'))
-                col = col + 1
-                self.dispatch(Events.CURSOR_SET, (row, col))
-            row = row + 1
+        if isinstance(arg, str) and arg:
+            self._path = arg
+        # the export job gets a copy: editing goes on while it runs
+        grid = self._grid.copy()
+        measures = self._grid.pop_dirty()
+        path = self._path
+        self._jobs.submit(
+            lambda: self._export(grid, measures, path),
+            lambda path, error: self._on_export(path, error, measures))
 
     w = write
 
-    def _on_drumtab_ready(self, arg) -> None:
-        self.ymin, self.xmin, self.ymax, self.xmax = arg
+    def stats(self, arg=None) -> None:
+        # ':stats' turns event statistics on, then shows their summary;
+        # ':stats off' turns them off
+        bus = self.bus
+        if arg == "off":
+            bus.stats = None
+            self.dispatch(Events.INFO, "stats off")
+        elif bus.stats is None:
+            bus.stats = EventStats()
+            self.dispatch(Events.INFO, "stats on")
+        else:
+            self.dispatch(Events.INFO, bus.stats.summary())
 
 
 class CommandLine(Row):
@@ -335,7 +754,7 @@ class CommandLine(Row):
         self.dispatch(Events.K_RIGHT, curses.KEY_RIGHT)
 
     def _on_keypress(self, arg) -> None:
-        if arg > 32 and arg < 126 and self._active:
+        if 32 <= arg < 127 and self._active:
             self.update_command(arg)
             self.dispatch(Events.K_RIGHT, curses.KEY_RIGHT)
             self._x = self._x + 1
@@ -353,12 +772,15 @@ class CommandLine(Row):
         self._history.append(self._command)
         self.dispatch(Events.COMMAND_SEND, self._command)
         self._active = False
+        # queued before the command runs: what the command reports is
+        # delivered after the mode change
+        self.dispatch(Events.K_ESC, None)
+        command, _, arg = self._command[1:].partition(" ")
         try:
-            self._commands[self._command[1:]](self._cmd_arg)
+            self._commands[command](arg.strip() or self._cmd_arg)
             self._cmd_arg = None
         except KeyError:
             self.set_content(self._screen_h-1, 0, "> unkown command")
-        self.dispatch(Events.K_ESC, None)
 
     def _on_esc_keypress(self, arg) -> None:
         self._active = False
@@ -368,26 +790,64 @@ class CommandLine(Row):
 
 class DrumTab(Component):
 
-    def __init__(self, stdscr: window) -> None:
+    def __init__(self, stdscr: window, grid: DrumGrid) -> None:
         super().__init__("drumtab", stdscr)
+        self._grid = grid
+        self._y = self._x = 0
+        self._y_max = self._x_max = 0
+        self._start_x = 0
+        self._pitch_width = 0
+        self._footer = ""
+        self._drumtab_height = 0
+        self._drumtab_rows_max = 0
+        self._measures_per_row = 0
+        # first system on screen: the view is a window over the grid,
+        # and only the systems in it are ever drawn
+        self._top = 0
+        self._playhead = None
+        self._playhead_step = None
+        self._history = GridHistory(grid)
+        # VISUAL mode: the block between the anchor and the cursor cells
+        self._cursor_yx = None
+        self._anchor = None
+        self._corner = None
+        self._selection = None
+        self._count = ""
+        self._register = None
+        self._events_action[Events.K_PRESS.value] = self._on_keypress
+        self._events_action[Events.PASTE.value] = self._on_paste
+        self._events_action[Events.CELL_EDIT.value] = self._on_cell_edit
+        self._events_action[Events.PLAYHEAD.value] = self._on_playhead
+        self._events_action[Events.CURSOR_MOVE.value] = self._on_cursor_move
+        self._events_action[Events.UNDO.value] = self._on_undo
+        self._events_action[Events.REDO.value] = self._on_redo
+        for event in (Events.COMMAND, Events.INSERT,
+                      Events.VISUAL, Events.PLAYBACK):
+            self._events_action[event.value] = self._on_mode_change
+        self._coalesce.add(Events.PLAYHEAD)
+
+    @property
+    def grid(self) -> DrumGrid:
+        return self._grid
+
+    @property
+    def top(self) -> int:
+        return self._top
+
+    @property
+    def history(self) -> GridHistory:
+        return self._history
 
     def draw(self) -> (int, int):
         height, width = self._stdscr.getmaxyx()
         # Render drumtab bar
-        pitches = ["ride", "sn", "bd", "chp"]
-        time = "4/4"
-        beats, division = time.split('/')
-        beats = int(beats)
-        division = int(division)
-        subdivision = 16
-        # measures = 2
+        pitches = self._grid.pitches
         sep = '|'
-        note = '-'
 
         drumtab_height = len(pitches) + 1
         drumtab_rows_max = (height - 6) // drumtab_height
 
-        notesstr_len = (subdivision // division)*beats
+        notesstr_len = self._grid.measure_steps
         pitchesstr_len_max = 0
         for p in pitches:
             if len(p) > pitchesstr_len_max:
@@ -409,43 +869,394 @@ class DrumTab(Component):
         cursor_x_max = cursor_x + (notesstr_len + len(sep))*measures_per_row
         cursor_y_max = cursor_y + drumtab_height*drumtab_rows_max - 1
 
+        self._y, self._x = cursor_y, cursor_x
+        self._y_max, self._x_max = cursor_y_max, cursor_x_max
+        self._start_x = start_x_drumtab_row
+        self._pitch_width = pitchesstr_len_max
+        self._drumtab_height = drumtab_height
+        self._drumtab_rows_max = drumtab_rows_max
+        self._measures_per_row = measures_per_row
+
         self.dispatch(Events.DRUMTAB_READY, (
             cursor_y, cursor_x,
             cursor_y_max, cursor_x_max
         ))
 
-        while drumtab_rows_max > 0:
-            drumtab_rows_max = drumtab_rows_max - 1
-            for p in pitches:
-                pitches_col = " "*(pitchesstr_len_max-len(p)) + p + sep
-                notes_col = (note*notesstr_len + sep)*measures_per_row
-                drumtab_row = pitches_col + notes_col
-                self._stdscr.addstr(
-                    start_y_drumtab_row,
-                    start_x_drumtab_row,
-                    drumtab_row,
-                )
-                start_y_drumtab_row = start_y_drumtab_row + 1
-
-            drumtab_footer_pc = " "*(pitchesstr_len_max) + sep
-            drumtab_footer = ""
-            j = 1
-            for i in range(subdivision):
-                if not (i % 4):
-                    drumtab_footer = drumtab_footer + str(j)
-                    j = j + 1
-                else:
-                    drumtab_footer = drumtab_footer + "•"
-            drumtab_footer = (drumtab_footer + sep)*measures_per_row
-            self._stdscr.addstr(
-                start_y_drumtab_row,
-                start_x_drumtab_row,
-                drumtab_footer_pc + drumtab_footer,
-            )
-            start_y_drumtab_row = start_y_drumtab_row + 1
+        drumtab_footer_pc = " "*(pitchesstr_len_max) + sep
+        drumtab_footer = ""
+        j = 1
+        for i in range(notesstr_len):
+            if not (i % self._grid.beat_steps):
+                drumtab_footer = drumtab_footer + str(j)
+                j = j + 1
+            else:
+                drumtab_footer = drumtab_footer + "•"
+        drumtab_footer = (drumtab_footer + sep)*measures_per_row
+        self._footer = drumtab_footer_pc + drumtab_footer
+
+        for row in range(drumtab_rows_max):
+            self._draw_system(row)
 
         return cursor_y, cursor_x
 
+    def _draw_system(self, row: int) -> None:
+        # the system shown on the row-th tab row of the screen
+        y = self._y + row * self._drumtab_height
+        measure = (self._top + row) * self._measures_per_row
+        for p in self._grid.pitches:
+            pitches_col = " "*(self._pitch_width-len(p)) + p + '|'
+            notes_col = self._grid.render(p, measure, self._measures_per_row)
+            self._stdscr.addstr(y, self._start_x, pitches_col + notes_col)
+            y = y + 1
+        self._stdscr.addstr(y, self._start_x, self._footer)
+
+    def scroll(self, systems: int) -> None:
+        # the systems still on screen are moved by the terminal; only the
+        # ones scrolled in are drawn
+        top = max(self._top + systems, 0)
+        systems = top - self._top
+        rows_max = self._drumtab_rows_max
+        if not systems or not rows_max:
+            return
+        if self._playhead is not None:
+            self._stdscr.chgat(*self._playhead, 1, curses.A_NORMAL)
+            self._playhead = None
+        selection = self._selection
+        self._select(None)
+        self._top = top
+        if abs(systems) >= rows_max:
+            rows = range(rows_max)
+        else:
+            self._stdscr.scroll(
+                self._y, self._y_max, systems * self._drumtab_height)
+            if systems > 0:
+                rows = range(rows_max - systems, rows_max)
+            else:
+                rows = range(-systems)
+        for row in rows:
+            self._draw_system(row)
+        self._select(selection)
+        self._on_playhead(self._playhead_step)
+
+    def _on_cursor_move(self, yx: (int, int)) -> None:
+        # stepping off the top or bottom of the tab scrolls one system
+        y, x = yx
+        self._cursor_yx = yx
+        if x < self._x or x >= self._x_max or not self._drumtab_rows_max:
+            return
+        if y == self._y - 1 and self._top > 0:
+            self.scroll(-1)
+            self.dispatch(Events.CURSOR_SET, (y + self._drumtab_height, x))
+        elif y == self._y_max + 1:
+            self.scroll(1)
+            self.dispatch(Events.CURSOR_SET, (y - self._drumtab_height, x))
+        elif self._mode == InputMode.VISUAL and self._anchor is not None:
+            cell = self.cell(y, x)
+            if cell is not None:
+                self._corner = cell
+                self._select(self._block())
+
+    def cell(self, y: int, x: int) -> (int, int):
+        if y < self._y or x < self._x or not self._drumtab_rows_max:
+            return None
+        row, pitch = divmod(y - self._y, self._drumtab_height)
+        measure, step = divmod(x - self._x, self._grid.measure_steps + 1)
+        if row >= self._drumtab_rows_max or pitch >= len(self._grid.pitches):
+            return None
+        if measure >= self._measures_per_row \
+                or step == self._grid.measure_steps:
+            return None
+        measure = (self._top + row) * self._measures_per_row + measure
+        return pitch, measure * self._grid.measure_steps + step
+
+    def cell_yx(self, pitch: int, step: int) -> (int, int):
+        # screen position of a cell, None when scrolled out
+        measure, step = divmod(step, self._grid.measure_steps)
+        if not self._measures_per_row:
+            return None
+        row, measure = divmod(measure, self._measures_per_row)
+        row = row - self._top
+        if row < 0 or row >= self._drumtab_rows_max:
+            return None
+        y = self._y + row * self._drumtab_height + pitch
+        x = self._x + measure * (self._grid.measure_steps + 1) + step
+        return y, x
+
+    def step_yx(self, step: int) -> (int, int):
+        # screen position of a step in its system's footer row
+        return self.cell_yx(len(self._grid.pitches), step)
+
+    def show(self, step: int) -> None:
+        # scrolls as little as needed for step's system to be on screen
+        if not self._measures_per_row:
+            return
+        system = step // self._grid.measure_steps // self._measures_per_row
+        if system < self._top:
+            self.scroll(system - self._top)
+        elif system >= self._top + self._drumtab_rows_max:
+            self.scroll(system - self._top - self._drumtab_rows_max + 1)
+
+    def draw_steps(self, start: int, stop: int) -> None:
+        # redraws the systems on screen holding any of steps start..stop
+        if not self._measures_per_row or stop <= start:
+            return
+        system_steps = self._grid.measure_steps * self._measures_per_row
+        first = max(start // system_steps, self._top)
+        last = min((stop - 1) // system_steps,
+                   self._top + self._drumtab_rows_max - 1)
+        for system in range(first, last + 1):
+            self._draw_system(system - self._top)
+
+    def _block(self) -> (int, int, int, int):
+        # (first pitch, last pitch, start step, stop step)
+        (p0, s0), (p1, s1) = self._anchor, self._corner
+        return min(p0, p1), max(p0, p1), min(s0, s1), max(s0, s1) + 1
+
+    def _block_spans(self, block):
+        # (y, x, length) of each measure's worth of the block on screen
+        p0, p1, start, stop = block
+        measure_steps = self._grid.measure_steps
+        system_steps = measure_steps * self._measures_per_row
+        step = max(start, self._top * system_steps)
+        stop = min(stop, (self._top + self._drumtab_rows_max) * system_steps)
+        while step < stop:
+            end = min(stop, (step // measure_steps + 1) * measure_steps)
+            y, x = self.cell_yx(p0, step)
+            for pitch in range(p1 - p0 + 1):
+                yield y + pitch, x, end - step
+            step = end
+
+    def _select(self, block) -> None:
+        if block == self._selection:
+            return
+        if self._selection is not None:
+            for y, x, length in self._block_spans(self._selection):
+                self._stdscr.chgat(y, x, length, curses.A_NORMAL)
+        self._selection = block
+        if block is not None:
+            for y, x, length in self._block_spans(block):
+                self._stdscr.chgat(y, x, length, curses.A_REVERSE)
+
+    def _end_visual(self, info: str = None) -> None:
+        self._select(None)
+        self._anchor = self._corner = None
+        self._count = ""
+        self._on_esc_keypress(None)
+        self.dispatch(Events.K_ESC, None)
+        if info is not None:
+            self.dispatch(Events.INFO, info)
+
+    def _on_visual_keypress(self, k: int) -> None:
+        if ord('0') <= k <= ord('9'):
+            self._count = self._count + chr(k)
+            return
+        if self._anchor is None or not 0 < k < 256:
+            return
+        p0, p1, start, stop = self._block()
+        pitches = range(p0, p1 + 1)
+        count = int(self._count or 1)
+        size = "{}x{}".format(len(pitches), stop - start)
+        if k == ord('y'):
+            self._register = self._grid.block(pitches, start, stop)
+            self._end_visual("yanked " + size)
+            return
+        if k == ord('d') or k == 32:
+            self._history.fill(pitches, start, stop, EMPTY)
+            info = "cleared " + size
+        elif k in HITS:
+            self._history.fill(pitches, start, stop, k)
+            info = "filled {} with {}".format(size, chr(k))
+        elif k == ord('*'):
+            self._history.repeat(pitches, start, stop, count)
+            info = "repeated {} {} times".format(size, count)
+            stop = stop + (stop - start) * count
+        elif k == ord('>') or k == ord('<'):
+            steps = count if k == ord('>') else -count
+            self._history.shift(pitches, start, stop, steps)
+            info = "shifted {} by {}".format(size, steps)
+        else:
+            return
+        self._end_visual(info)
+        self.draw_steps(start, stop)
+
+    def _on_paste(self, text: str) -> None:
+        # a tab with pitch names fills those rows, bare lines of hits fill
+        # the rows from the cursor's down; all from the cursor's step
+        if self._mode != InputMode.INSERT or self._cursor_yx is None:
+            return
+        cell = self.cell(*self._cursor_yx)
+        if cell is None:
+            return
+        pitch, step = cell
+        lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        rows = {
+            self._grid.index(name): row
+            for name, row in tab_rows(lines).items()
+            if name in self._grid.pitches
+        }
+        if not rows:
+            bare = [_.strip().replace("|", "") for _ in lines if _.strip()]
+            rows = {
+                pitch + i: row for i, row in enumerate(bare)
+                if pitch + i < len(self._grid.pitches)
+            }
+        rows = {
+            index: row.replace(" ", chr(EMPTY)).encode("ascii", "replace")
+            for index, row in rows.items()
+        }
+        for row in rows.values():
+            unknown = row.translate(None, HITS + bytes([EMPTY]))
+            if unknown:
+                self.dispatch(Events.INFO, "paste: unknow hit {}".format(
+                    chr(unknown[0])))
+                return
+        if not rows:
+            return
+        self._history.begin()
+        for index, row in rows.items():
+            self._history.set_slice(index, step, row)
+        self._history.end()
+        stop = step + max(len(_) for _ in rows.values())
+        self.show(stop)
+        self.draw_steps(step, stop)
+        self.dispatch(Events.CURSOR_SET, self.cell_yx(pitch, stop))
+        self.dispatch(Events.INFO, "pasted {}x{}".format(
+            len(rows), stop - step))
+
+    def _on_keypress(self, k: int) -> None:
+        if self._mode == InputMode.VISUAL:
+            self._on_visual_keypress(k)
+        elif self._mode == InputMode.WAIT and k == ord('P') \
+                and self._register and self._cursor_yx is not None:
+            cell = self.cell(*self._cursor_yx)
+            if cell is None:
+                return
+            pitch, step = cell
+            self._history.paste(self._register, pitch, step)
+            self.draw_steps(step, step + len(self._register[0]))
+
+    def draw_cells(self, cells) -> None:
+        # redraws just the given (pitch, step) cells that are on screen
+        for pitch, step in cells:
+            yx = self.cell_yx(pitch, step)
+            if yx is not None:
+                self._stdscr.addch(*yx, self._grid.get(pitch, step))
+
+    def _show_edit(self, cells: list) -> None:
+        if not cells:
+            return
+        pitch, step = min(cells, key=lambda _: (_[1], _[0]))
+        self.show(step)
+        self.draw_cells(cells)
+        self.dispatch(Events.CURSOR_SET, self.cell_yx(pitch, step))
+
+    def _on_undo(self, dummy) -> None:
+        if self._mode == InputMode.WAIT:
+            self._show_edit(self._history.undo())
+
+    def _on_redo(self, dummy) -> None:
+        if self._mode == InputMode.WAIT:
+            self._show_edit(self._history.redo())
+
+    def _on_mode_change(self, mode: InputMode) -> bool:
+        if not super()._on_mode_change(mode):
+            return False
+        # an insert session, up to ESC, is one undo step
+        if mode == InputMode.INSERT:
+            self._history.begin()
+        elif mode == InputMode.VISUAL and self._cursor_yx is not None:
+            self._anchor = self._corner = self.cell(*self._cursor_yx)
+            if self._anchor is not None:
+                self._select(self._block())
+        return True
+
+    def _on_esc_keypress(self, dummy) -> bool:
+        mode = self._mode
+        if not super()._on_esc_keypress(dummy):
+            return False
+        if mode == InputMode.INSERT:
+            self._history.end()
+        elif mode == InputMode.VISUAL:
+            self._select(None)
+            self._anchor = self._corner = None
+            self._count = ""
+        return True
+
+    def _on_playhead(self, step: int) -> None:
+        if self._playhead is not None:
+            self._stdscr.chgat(*self._playhead, 1, curses.A_NORMAL)
+        self._playhead_step = step
+        self._playhead = None if step is None else self.step_yx(step)
+        if self._playhead is not None:
+            self._stdscr.chgat(*self._playhead, 1, curses.A_REVERSE)
+
+    def _on_cell_edit(self, yxk: (int, int, int)) -> None:
+        y, x, k = yxk
+        cell = self.cell(y, x)
+        if cell is None or self._mode != InputMode.INSERT:
+            return
+        if k == 32:
+            k = EMPTY
+        pitch, step = cell
+        self._history.set(pitch, step, k)
+        self._stdscr.addch(y, x, k)
+        self.dispatch(Events.K_RIGHT, curses.KEY_RIGHT)
+
+
+class Playback(Component):
+
+    def __init__(
+        self,
+        stdscr: window,
+        grid: DrumGrid,
+        sink=None,
+        tempo: int = 120,
+    ) -> None:
+        super().__init__("playback", stdscr)
+        self._grid = grid
+        # the playhead is the output: nothing is kept while playing
+        self._sink = NullSink() if sink is None else sink
+        self._tempo = tempo
+        self._player = None
+        self._position = None
+        self._mode_actions[InputMode.PLAYBACK.value] = self.start
+        self._events_action[Events.PLAYBACK.value] = self._on_playback
+        self._events_action[Events.K_ESC.value] = self._on_esc_keypress
+
+    @property
+    def playing(self) -> bool:
+        return self._player is not None and self._player.playing
+
+    def start(self) -> None:
+        self._player = Player(
+            self._grid, self._sink, tempo=self._tempo, loop=True)
+        self._player.start()
+
+    def stop(self) -> None:
+        if self._player is None:
+            return
+        self._player.stop()
+        self.poll()
+        self.dispatch(Events.INFO, str(self._player.jitter))
+        self._player = None
+
+    def poll(self) -> bool:
+        # the player thread only publishes its position: curses is drawn
+        # from the main loop
+        position = None if self._player is None else self._player.position
+        if position == self._position:
+            return False
+        self._position = position
+        self.dispatch(Events.PLAYHEAD, position)
+        return True
+
+    def _on_playback(self, dummy) -> None:
+        self._on_mode_change(InputMode.PLAYBACK)
+
+    def _on_esc_keypress(self, dummy) -> None:
+        if super()._on_esc_keypress(None):
+            self.stop()
+
 
 class MainWindow(Component):
 
@@ -467,17 +1278,17 @@ class Cursor(Component):
         self._x: int = 0
         self._history: list[(int, int)] = [(0, 0)]
         self._commandline: bool = False
-        self._insert: bool = False
         self._stdscr = stdscr
         self._events_action[Events.CURSOR_SET.value] = self._on_cursor_set
         self._events_action[Events.K_LEFT.value] = self._left
         self._events_action[Events.K_UP.value] = self._up
         self._events_action[Events.K_RIGHT.value] = self._right
         self._events_action[Events.K_DOWN.value] = self._down
-        self._events_action[Events.INSERT.value] = self._on_insert
+        for event in (Events.INSERT, Events.VISUAL, Events.PLAYBACK):
+            self._events_action[event.value] = self._on_mode_change
         self._events_action[Events.K_PRESS.value] = self._on_keypress
         self._events_action[Events.COMMAND.value] = self._command_line_on
-        self._events_action[Events.K_ESC.value] = self._command_line_off
+        self._events_action[Events.K_ESC.value] = self._on_esc_keypress
         self._events_action[Events.K_ENTER.value] = self._command_line_off
 
     @property
@@ -521,27 +1332,15 @@ class Cursor(Component):
     def restore(self) -> (int, int):
         self.coordinates = self._history.pop()
 
-    def _on_insert(self, args):
-        if self._insert is False:
-            self._insert = True
-
     def _on_keypress(self, args):
-        if self._insert is True \
-            and self._stdscr.inch(self._y, self._x) == 45 \
-                and args in [
-                    111, 79,  # o, O
-                    120, 88,  # x, X
-                    103,      # g
-                    114, 82,  # r, R
-                    108, 75,  # l, L
-                    32,       # space
-                ]:
-            if args == 32:
-                args = 45
-            self._stdscr.addch(self._y, self._x, args)
-            self._right(None)
-
-    def _command_line_on(self, args) -> None:
+        # cells are edited in INSERT entered from WAIT only, as DrumTab
+        # tracks it: an 'i' in VISUAL or PLAYBACK is no insert
+        if self._mode == InputMode.INSERT \
+                and (args == 32 or 0 < args < 256 and args in HITS):
+            self.dispatch(Events.CELL_EDIT, (self._y, self._x, args))
+
+    def _command_line_on(self, mode) -> None:
+        self._on_mode_change(mode)
         if self._commandline is False:
             self._commandline = True
             self.save()
@@ -551,33 +1350,94 @@ class Cursor(Component):
         if self._commandline is True:
             self._commandline = False
             self.restore()
-        if self._insert is True:
-            self._insert = False
+
+    def _on_esc_keypress(self, dummy) -> bool:
+        self._command_line_off(None)
+        return super()._on_esc_keypress(dummy)
+
+
+# playhead redraws per second
+FRAME_RATE = 60
+
+
+async def run(screen: Screen, kinput, cursor, playback) -> None:
+    # keys are read when stdin is readable, never blocking the loop;
+    # everything touching curses runs on this loop's thread, and each
+    # batch of keys or frame ends in at most one screen update
+    loop = asyncio.get_running_loop()
+    stopped = loop.create_future()
+    bus = kinput.bus
+
+    def on_input() -> None:
+        try:
+            # curses may buffer more keys than stdin reports. Each key's
+            # cascade is drained before the next key: handlers post events
+            # that belong to their key (K_ESC after a command, K_RIGHT
+            # after a cell edit). Coalesced events wait for the batch.
+            while kinput.listen():
+                bus.drain(coalesced=False)
+            bus.drain()
+        except SystemExit:
+            if not stopped.done():
+                stopped.set_result(None)
+            return
+        cursor.move()
+        screen.flush()
+
+    async def frames() -> None:
+        # the playhead, and whatever background job callbacks drew
+        while True:
+            await asyncio.sleep(1 / FRAME_RATE)
+            playback.poll()
+            bus.drain()
+            cursor.move()
+            screen.flush()
+
+    screen.nodelay(True)
+    loop.add_reader(sys.stdin.fileno(), on_input)
+    frames_task = loop.create_task(frames())
+    try:
+        await stopped
+    finally:
+        loop.remove_reader(sys.stdin.fileno())
+        frames_task.cancel()
+        playback.stop()
 
 
 def draw_menu(stdscr):
     curses.nonl()
     curses.set_escdelay(25)
     stdscr.clear()
+    stdscr.refresh()
+    stdscr = Screen(stdscr)
+    sys.stdout.write("\x1b[?2004h")
+    sys.stdout.flush()
+    if STATS_PATH:
+        _bus.stats = EventStats()
 
     kinput = KInput(stdscr)
     header = Header(stdscr)
     statusbar = StatusBar(stdscr)
-    commands = Commands(stdscr)
+    grid = DrumGrid()
+    jobs = Jobs()
+    commands = Commands(stdscr, grid, jobs)
     cli = CommandLine(stdscr)
     cli.register_commands(commands.commands)
     cursor = Cursor(stdscr)
-    dt = DrumTab(stdscr)
+    dt = DrumTab(stdscr, grid)
+    playback = Playback(stdscr, grid)
 
     header.title = "DrumpondNC"
 
-    dt.register(Events.DRUMTAB_READY, commands)
-    commands.register(Events.CURSOR_SET, cursor)
+    cursor.register(Events.CELL_EDIT, dt)
+    dt.register(Events.K_RIGHT, cursor)
 
     kinput.register(Events.K_ARROWS, cursor)
     cli.register(Events.K_ARROWS, cursor)
 
     cursor.register(Events.CURSOR_MOVE, statusbar)
+    cursor.register(Events.CURSOR_MOVE, dt)
+    dt.register(Events.CURSOR_SET, cursor)
 
     kinput.register(Events.K_ESC, cli)
     kinput.register(Events.K_ESC, statusbar)
@@ -594,22 +1454,37 @@ def draw_menu(stdscr):
 
     kinput.register(Events.K_ENTER, cli)
 
+    kinput.register(Events.MODE_CHANGE, dt)
+    kinput.register(Events.K_ESC, dt)
+    cli.register(Events.K_ESC, dt)
+    kinput.register(Events.UNDO, dt)
+    kinput.register(Events.K_PRESS, dt)
+    kinput.register(Events.PASTE, dt)
+    dt.register(Events.K_ESC, statusbar)
+    dt.register(Events.K_ESC, cursor)
+    dt.register(Events.INFO, statusbar)
+    kinput.register(Events.REDO, dt)
+
+    kinput.register(Events.PLAYBACK, playback)
+    kinput.register(Events.K_ESC, playback)
+    playback.register(Events.PLAYHEAD, dt)
+    playback.register(Events.INFO, statusbar)
+    commands.register(Events.INFO, statusbar)
+
     start_y, start_x = dt.draw()
     cursor.coordinates = (start_y, start_x)
-    stdscr.refresh()
-    counter = 0
-    stop = False
+    kinput.bus.drain()
     cursor.move()
-    while not stop:
-
-        # if counter > 10:
-        #     stop = True
-
-        kinput.listen()
-        cursor.move()
-        counter = counter + 1
-        # stdscr.clear()
-        # stdscr.refresh()
+    stdscr.flush()
+    try:
+        asyncio.run(run(stdscr, kinput, cursor, playback))
+    finally:
+        # a running export finishes before the terminal is restored
+        jobs.shutdown()
+        sys.stdout.write("\x1b[?2004l")
+        sys.stdout.flush()
+        if kinput.bus.stats is not None:
+            kinput.bus.stats.dump(STATS_PATH or STATS_DEFAULT_PATH)
 
 
 def main():
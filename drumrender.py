@@ -0,0 +1,724 @@
+import argparse
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import re
+import selectors
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from drumlayout import LAYOUT_DIR, LAYOUT_FILES, LayoutResources
+from drumlayout import layout_resources
+
+
+_formats = ("pdf", "png")
+_server_file = os.path.join(LAYOUT_DIR, "server.ly")
+_reply_prefix = b"drumpond: "
+
+
+def lilypond_server_command(format: str = "pdf", lilypond: str = "lilypond"):
+    return [lilypond, f"--{format}", _server_file]
+
+
+def fake_server_command(format: str = "pdf"):
+    code = "import sys; sys.path.insert(0, {!r}); import drumrender; " \
+        "drumrender.fake_server({!r})".format(
+            os.path.dirname(os.path.abspath(__file__)), format)
+    return [sys.executable, "-c", code]
+
+
+def fake_server(format: str = "pdf") -> None:
+    # stands in for layout/server.ly: copies the .ly text as the output
+    def reply(string):
+        sys.stdout.write(f"drumpond: {string}\n")
+        sys.stdout.flush()
+    reply("ready")
+    for line in sys.stdin:
+        fields = line.rstrip("\n").split("\t")
+        if len(fields) != 2:
+            reply("error bad-job")
+            continue
+        directory, file_name = fields
+        try:
+            with open(os.path.join(directory, file_name)) as ly_file:
+                ly_text = ly_file.read()
+        except OSError:
+            reply("error ly-file-failed")
+            continue
+        if "BROKEN" in ly_text:
+            reply("error ly-file-failed")
+            continue
+        base = os.path.splitext(file_name)[0]
+        with open(os.path.join(directory, f"{base}.{format}"), "w") as output:
+            output.write(ly_text)
+        reply("ok")
+
+
+# pids of the servers not closed yet, started ones included: see
+# _worker_exit()
+_server_pids: set = set()
+
+
+class LilyPondServer():
+
+    def __init__(
+        self,
+        command=None,
+        format: str = "pdf",
+        stderr=None,
+        timeout: float = None,
+    ) -> None:
+        # timeout bounds the wait for the server's "ready" too
+        if format not in _formats:
+            raise ValueError(f"{format!r} is not a render format.")
+        self._command = command or lilypond_server_command(format)
+        self._format = format
+        self._process = subprocess.Popen(
+            self._command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL if stderr is None else stderr,
+        )
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._process.stdout, selectors.EVENT_READ)
+        _server_pids.add(self._process.pid)
+        self._buffer = b""
+        self.jobs = 0
+        reply = self._read_reply(timeout)
+        if reply != "ready":
+            self.close()
+            raise RuntimeError(f"lilypond server failed to start: {reply}")
+
+    @property
+    def format(self) -> str:
+        return self._format
+
+    @property
+    def alive(self) -> bool:
+        return self._process.poll() is None
+
+    @property
+    def pid(self) -> int:
+        return self._process.pid
+
+    def _read_reply(self, timeout: float) -> str:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        fd = self._process.stdout.fileno()
+        while True:
+            line, newline, rest = self._buffer.partition(b"\n")
+            if newline:
+                self._buffer = rest
+                if line.startswith(_reply_prefix):
+                    return line[len(_reply_prefix):].decode()
+                # lilypond's own output
+                continue
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._selector.select(remaining):
+                    self.close()
+                    raise subprocess.TimeoutExpired(self._command, timeout)
+            data = os.read(fd, 65536)
+            if not data:
+                self.close()
+                raise RuntimeError("lilypond server exited.")
+            self._buffer = self._buffer + data
+
+    def engrave(self, ly_path: str, timeout: float = None) -> str:
+        directory, file_name = os.path.split(os.path.abspath(ly_path))
+        if "\t" in directory or "\n" in directory:
+            raise ValueError(f"{directory!r} is not a job directory.")
+        self._process.stdin.write(f"{directory}\t{file_name}\n".encode())
+        self._process.stdin.flush()
+        reply = self._read_reply(timeout)
+        self.jobs += 1
+        if reply != "ok":
+            raise RuntimeError(f"lilypond failed: {reply}")
+        base = os.path.splitext(file_name)[0]
+        return os.path.join(directory, f"{base}.{self._format}")
+
+    def close(self) -> None:
+        _server_pids.discard(self._process.pid)
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+        self._selector.close()
+        self._process.stdin.close()
+        self._process.stdout.close()
+
+
+class LilyPondPool():
+
+    def __init__(
+        self,
+        size: int = 2,
+        format: str = "pdf",
+        command=None,
+    ) -> None:
+        if size < 1:
+            raise ValueError(f"{size!r} is not a pool size.")
+        self._format = format
+        self._command = command
+        self._idle: queue.Queue = queue.Queue()
+        self._servers: list = []
+        self._lock = threading.Lock()
+        for _ in range(size):
+            self._idle.put(None)
+
+    @property
+    def format(self) -> str:
+        return self._format
+
+    def _start(self, timeout: float = None) -> LilyPondServer:
+        server = LilyPondServer(self._command, self._format, timeout=timeout)
+        with self._lock:
+            self._servers.append(server)
+        return server
+
+    def _discard(self, server) -> None:
+        with self._lock:
+            self._servers.remove(server)
+        server.close()
+
+    def engrave(self, ly_path: str, timeout: float = None) -> str:
+        # servers start on demand and are replaced when they die
+        server = self._idle.get()
+        try:
+            if server is not None and not server.alive:
+                self._discard(server)
+                server = None
+            if server is None:
+                server = self._start(timeout)
+            return server.engrave(ly_path, timeout)
+        finally:
+            if server is not None and not server.alive:
+                self._discard(server)
+                server = None
+            self._idle.put(server)
+
+    def close(self) -> None:
+        with self._lock:
+            servers, self._servers = self._servers, []
+        for server in servers:
+            server.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *arguments) -> None:
+        self.close()
+
+
+def _default_directory() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") \
+        or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "drumpond")
+
+
+class RenderCache():
+
+    def __init__(
+        self,
+        directory: str = None,
+        max_entries: int = 128,
+        layout: LayoutResources = None,
+        lilypond: str = "lilypond",
+        engraver: LilyPondPool = None,
+    ) -> None:
+        if max_entries < 1:
+            raise ValueError(f"{max_entries!r} is not a cache size.")
+        self._directory = directory or _default_directory()
+        self._max_entries = max_entries
+        self._layout = layout or layout_resources()
+        self._lilypond = lilypond
+        self._engraver = engraver
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self._directory, exist_ok=True)
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    def key(self, ly_text: str, format: str = "pdf") -> str:
+        if format not in _formats:
+            raise ValueError(f"{format!r} is not a render format.")
+        sha = hashlib.sha256(format.encode())
+        for name in LAYOUT_FILES:
+            if self._layout.exists(name):
+                sha.update(self._layout.digest(name))
+        sha.update(ly_text.encode())
+        return sha.hexdigest()
+
+    def path(self, key: str, format: str = "pdf") -> str:
+        return os.path.join(self._directory, f"{key}.{format}")
+
+    def get(self, key: str, format: str = "pdf") -> str:
+        path = self.path(key, format)
+        try:
+            # mtime is the recency of an entry
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, source: str, format: str = "pdf") -> str:
+        path = self.path(key, format)
+        os.replace(source, path)
+        os.utime(path)
+        self.evict()
+        return path
+
+    def entries(self) -> list:
+        entries = []
+        for entry in os.scandir(self._directory):
+            name, _, extension = entry.name.rpartition(".")
+            if extension not in _formats:
+                continue
+            try:
+                # other processes may evict the entry meanwhile
+                entries.append((entry.stat().st_mtime_ns, entry.path))
+            except FileNotFoundError:
+                pass
+        entries.sort()
+        return entries
+
+    def evict(self) -> None:
+        entries = self.entries()
+        excess = len(entries) - self._max_entries
+        for _, path in entries[:max(excess, 0)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self) -> None:
+        for _, path in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _engrave(
+        self,
+        ly_text: str,
+        format: str,
+        work_dir: str,
+        timeout: float = None,
+    ) -> str:
+        ly_path = os.path.join(work_dir, "score.ly")
+        with open(ly_path, "w") as ly_file:
+            ly_file.write(ly_text)
+        if self._engraver is not None and self._engraver.format == format:
+            return self._engraver.engrave(ly_path, timeout)
+        command = [
+            self._lilypond, f"--{format}", "-o", "score", "score.ly"]
+        result = subprocess.run(
+            command,
+            cwd=work_dir,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+        output = os.path.join(work_dir, f"score.{format}")
+        if not os.path.exists(output):
+            # multi-page png output is numbered: keeps the first page
+            output = os.path.join(work_dir, f"score-page1.{format}")
+        if result.returncode != 0 or not os.path.exists(output):
+            raise RuntimeError(
+                "lilypond failed: {}".format(result.stderr.strip()[-2000:]))
+        return output
+
+    def render(
+        self,
+        ly_text: str,
+        format: str = "pdf",
+        timeout: float = None,
+    ) -> str:
+        key = self.key(ly_text, format)
+        path = self.get(key, format)
+        if path is not None:
+            self.hits += 1
+            return path
+        self.misses += 1
+        work_dir = tempfile.mkdtemp(prefix="render-", dir=self._directory)
+        try:
+            output = self._engrave(ly_text, format, work_dir, timeout)
+            return self.put(key, output, format)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+_render_cache = None
+
+
+def render_cache() -> RenderCache:
+    global _render_cache
+    if _render_cache is None:
+        _render_cache = RenderCache()
+    return _render_cache
+
+
+def render(argument, format: str = "pdf", cache: RenderCache = None) -> str:
+    if cache is None:
+        cache = render_cache()
+    if isinstance(argument, str):
+        return cache.render(argument, format)
+    import drumpond
+    if isinstance(argument, drumpond.DrumScore):
+        argument = drumpond.make_lilypond_file(argument, include=True)
+    return cache.render(drumpond.lilypond(argument), format)
+
+
+_check_rows = {
+    "hh": "x-x-x-x-x-x-x-x-",
+    "sn": "----x-------x---",
+    "bd": "x-------x-x-----",
+}
+
+
+# what differs between two engravings of the same score: dates, the
+# IDs made from them, and the point-and-click links to the job's own
+# .ly path
+_volatile_re = re.compile(
+    rb"/(?:CreationDate|ModDate) ?\([^)]*\)|/ID ?\[<\w*> ?<\w*>\]"
+    rb"|<xmp:\w*Date>[^<]*|uuid:[-\w]*|textedit://[^)\s]*")
+
+
+def _engraving(path: str) -> bytes:
+    with open(path, "rb") as output:
+        return _volatile_re.sub(b"", output.read())
+
+
+def check_server(
+    format: str = "pdf",
+    lilypond: str = "lilypond",
+    server_command=None,
+) -> str:
+    # opt-in check of layout/server.ly against a real lilypond: a score
+    # engraved by the server must come out like one engraved directly,
+    # also on a second job once the first one's directory is gone
+    if shutil.which(lilypond) is None:
+        raise FileNotFoundError(f"{lilypond!r} is not installed.")
+    import drumpond
+    from drumgrid import DrumGrid
+    grid = DrumGrid.from_rows(_check_rows)
+    dscore = drumpond.DrumScore.from_grid(grid)
+    ly_text = drumpond.lilypond(
+        drumpond.make_lilypond_file(dscore, include=True))
+    command = server_command or lilypond_server_command(format, lilypond)
+    with tempfile.TemporaryDirectory(prefix="drumpond-check-") as directory:
+        cache = RenderCache(
+            os.path.join(directory, "direct"), lilypond=lilypond)
+        expected = _engraving(cache.render(ly_text, format))
+        with LilyPondPool(1, format, command) as pool:
+            cache = RenderCache(
+                os.path.join(directory, "server"), engraver=pool)
+            for i in range(2):
+                # a cache miss each time: both jobs go to the server
+                cache.clear()
+                if _engraving(cache.render(ly_text, format)) != expected:
+                    raise RuntimeError(
+                        f"server job {i + 1} differs from lilypond's output.")
+    return f"lilypond server ok: 2 {format} jobs"
+
+
+def _job_name(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _read_jobs(path: str) -> list:
+    with open(path) as job_file:
+        argument = json.load(job_file)
+    if isinstance(argument, dict):
+        argument = argument.get("jobs", [argument])
+    jobs = []
+    for i, job in enumerate(argument):
+        if isinstance(job, str):
+            job_path = os.path.join(os.path.dirname(path), job)
+            jobs.extend(_read_jobs(job_path))
+            continue
+        job = dict(job)
+        if "name" not in job:
+            job["name"] = _job_name(path) if len(argument) == 1 \
+                else f"{_job_name(path)}-{i + 1}"
+        jobs.append(job)
+    return jobs
+
+
+def load_jobs(path: str) -> list:
+    if not os.path.isdir(path):
+        return _read_jobs(path)
+    jobs = []
+    for name in sorted(os.listdir(path)):
+        if name.endswith(".json"):
+            jobs.extend(_read_jobs(os.path.join(path, name)))
+    return jobs
+
+
+_worker_pools: dict = {}
+
+
+def _worker_pool(format: str, command=None) -> LilyPondPool:
+    # one server per batch process, reused by all of its jobs
+    pool = _worker_pools.get(format)
+    if pool is None:
+        pool = LilyPondPool(1, format, command)
+        _worker_pools[format] = pool
+    return pool
+
+
+def _worker_exit(signum, frame) -> None:
+    # a batch worker stopped past its deadline takes its servers along;
+    # nothing here may wait: a second SIGTERM would re-enter it, and
+    # the orphaned servers are reaped by init
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    for pid in list(_server_pids):
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    os._exit(1)
+
+
+def _init_worker(pids) -> None:
+    signal.signal(signal.SIGTERM, _worker_exit)
+    pids.put(os.getpid())
+
+
+def engrave_job(
+    job: dict,
+    output_dir: str,
+    format: str = "pdf",
+    cache_dir: str = None,
+    timeout: float = None,
+    server_command=None,
+) -> str:
+    import drumpond
+    from drumgrid import DrumGrid
+    grid = DrumGrid.from_rows(
+        job["rows"],
+        time=tuple(job.get("time", (4, 4))),
+        subdivision=job.get("subdivision", 16),
+    )
+    dscore = drumpond.DrumScore.from_grid(grid)
+    lilypond_file = drumpond.make_lilypond_file(dscore, include=True)
+    ly_text = drumpond.lilypond(lilypond_file)
+    base = os.path.join(output_dir, job["name"])
+    with open(f"{base}.ly", "w") as ly_file:
+        ly_file.write(ly_text)
+    if format is None:
+        return f"{base}.ly"
+    if server_command is not None:
+        engraver = _worker_pool(format, server_command)
+        cache = RenderCache(cache_dir, engraver=engraver)
+    elif cache_dir:
+        cache = RenderCache(cache_dir)
+    else:
+        cache = render_cache()
+    path = cache.render(ly_text, format, timeout=timeout)
+    shutil.copyfile(path, f"{base}.{format}")
+    return f"{base}.{format}"
+
+
+class BatchReport():
+
+    def __init__(self) -> None:
+        self.done: list = []
+        self.failures: list = []
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self) -> float:
+        if not self.elapsed:
+            return 0.0
+        return (len(self.done) + len(self.failures)) / self.elapsed
+
+    def __str__(self) -> str:
+        lines = ["{} engraved, {} failed in {:.2f}s ({:.2f} jobs/s)".format(
+            len(self.done), len(self.failures), self.elapsed, self.throughput)]
+        for name, error in self.failures:
+            lines.append(f"FAILED {name}: {error}")
+        return "\n".join(lines)
+
+
+def _job_error(error) -> str:
+    if isinstance(error, subprocess.TimeoutExpired):
+        return f"timeout after {error.timeout}s"
+    return f"{type(error).__name__}: {error}"
+
+
+# how often futures are checked for having reached a worker
+_batch_poll = 0.05
+
+
+def _start_pool(workers: int, pids):
+    # each worker reports its pid on start, for _stop_pool()
+    return concurrent.futures.ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(pids,))
+
+
+def _stop_pool(executor, pids) -> None:
+    # workers past their deadline would never finish: kill them
+    executor.shutdown(wait=False, cancel_futures=True)
+    while not pids.empty():
+        try:
+            os.kill(pids.get(), signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def engrave_batch(
+    jobs,
+    output_dir: str,
+    workers: int = None,
+    queue_size: int = None,
+    timeout: float = None,
+    format: str = "pdf",
+    cache_dir: str = None,
+    server_command=None,
+) -> BatchReport:
+    # timeout bounds each job from when a worker takes it up; jobs past
+    # it are reported as failures and their workers are not waited for
+    workers = workers or os.cpu_count() or 1
+    queue_size = queue_size or 2 * workers
+    os.makedirs(output_dir, exist_ok=True)
+    report = BatchReport()
+    start = time.perf_counter()
+    jobs = iter(jobs)
+    pending: dict = {}
+    deadlines: dict = {}
+    expired: set = set()
+    pids = multiprocessing.SimpleQueue()
+    executor = _start_pool(workers, pids)
+    try:
+        while True:
+            # bounded: at most queue_size jobs are built or queued at once
+            for job in jobs:
+                future = executor.submit(
+                    engrave_job,
+                    job,
+                    output_dir,
+                    format,
+                    cache_dir,
+                    timeout,
+                    server_command,
+                )
+                pending[future] = job
+                if len(pending) >= queue_size:
+                    break
+            if not pending:
+                break
+            wait_timeout = None
+            if timeout is not None:
+                # the pool marks one more job running than it has free
+                # workers: only the first ones are engraving
+                now = time.monotonic()
+                running = [_ for _ in pending if _.running()]
+                for future in running[:workers - len(expired)]:
+                    deadlines.setdefault(future, now + timeout)
+                remaining = [
+                    deadlines[_] - now for _ in pending if _ in deadlines]
+                if len(remaining) < len(pending):
+                    remaining.append(_batch_poll)
+                wait_timeout = max(min(remaining), 0)
+            done, _ = concurrent.futures.wait(
+                pending,
+                timeout=wait_timeout,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                name = pending.pop(future).get("name")
+                deadlines.pop(future, None)
+                try:
+                    report.done.append((name, future.result()))
+                except Exception as error:
+                    report.failures.append((name, _job_error(error)))
+            now = time.monotonic()
+            for future in list(pending):
+                deadline = deadlines.get(future)
+                if deadline is None or deadline > now or future.done():
+                    continue
+                name = pending.pop(future).get("name")
+                del deadlines[future]
+                expired.add(future)
+                report.failures.append((name, f"timeout after {timeout}s"))
+            if len(expired) >= workers:
+                # every worker is stuck: queued jobs go to a new pool
+                queued = list(pending.values())
+                pending.clear()
+                deadlines.clear()
+                expired.clear()
+                _stop_pool(executor, pids)
+                executor = _start_pool(workers, pids)
+                jobs = itertools.chain(queued, jobs)
+    finally:
+        if expired:
+            _stop_pool(executor, pids)
+        else:
+            executor.shutdown(wait=True)
+        pids.close()
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="drumrender", description="Engrave drum patterns in batch.")
+    parser.add_argument("jobs", nargs="?",
+                        help="directory of .json jobs or manifest")
+    parser.add_argument("-o", "--output", default=".")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("-q", "--queue-size", type=int, default=None)
+    parser.add_argument("-t", "--timeout", type=float, default=None,
+                        help="seconds each job may take")
+    parser.add_argument("-f", "--format", choices=_formats + ("ly",),
+                        default="pdf")
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--server", action="store_true",
+                        help="keep one lilypond server per worker")
+    parser.add_argument("--fake-server", action="store_true",
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--check-server", action="store_true",
+                        help="engrave a sample through layout/server.ly "
+                        "and exit, when lilypond is installed")
+    arguments = parser.parse_args(argv)
+    format = None if arguments.format == "ly" else arguments.format
+    server_command = None
+    if arguments.fake_server:
+        server_command = fake_server_command(format)
+    elif arguments.server:
+        server_command = lilypond_server_command(format)
+    if arguments.check_server:
+        try:
+            print(check_server(format or "pdf",
+                               server_command=server_command))
+        except FileNotFoundError as error:
+            print(f"{error} Server check skipped.", file=sys.stderr)
+        return 0
+    if arguments.jobs is None:
+        parser.error("the following arguments are required: jobs")
+    report = engrave_batch(
+        load_jobs(arguments.jobs),
+        arguments.output,
+        workers=arguments.workers,
+        queue_size=arguments.queue_size,
+        timeout=arguments.timeout,
+        format=format,
+        cache_dir=arguments.cache_dir,
+        server_command=server_command,
+    )
+    print(report, file=sys.stderr)
+    return 1 if report.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1415 @@
+import bisect
+import collections
+import copy
+import operator
+import re
+import sys
+import abjad
+from abjad import tag as _tag
+from abjad import configuration as _configuration
+from abjad import typings as _typings
+from abjad import duration as _duration
+from abjad import lyconst as _lyconst
+from abjad import Leaf, Container, Context, Component
+from abjad import Chord, NoteHead, Note, Rest
+from abjad import Duration, Score
+from abjad import tweaks as tweaksmodule
+from drumgrid import DrumGrid, EMPTY
+from drumlayout import layout_resources
+
+
+_drum_pitches: dict = {}
+_drum_pitch_ids: dict = {}
+_drum_pitch_names: list = []
+
+
+def _read_drumkit_aliases(string: str) -> dict:
+    aliases = {}
+    match = re.search(r"drumPitchNames\s*=\s*#'\((.*?)\n\)", string, re.S)
+    if match is not None:
+        for name, pitch in re.findall(r"\((\w+) \. (\w+)\)", match.group(1)):
+            aliases[name] = pitch
+    return aliases
+
+
+def _load_drum_pitches() -> None:
+    table = dict(_lyconst.drums)
+    resources = layout_resources()
+    if resources.exists("drumkit.ly"):
+        drumkit = resources.text("drumkit.ly")
+        for name, pitch in _read_drumkit_aliases(drumkit).items():
+            table.setdefault(name, table.get(pitch, pitch))
+    for pitch in list(table.values()):
+        table.setdefault(pitch, pitch)
+    names = sorted(set(table.values()))
+    ids = {pitch: i for i, pitch in enumerate(names)}
+    _drum_pitch_names[:] = [sys.intern(_) for _ in names]
+    _drum_pitches.update(
+        (name, _drum_pitch_names[ids[pitch]]) for name, pitch in table.items())
+    _drum_pitch_ids.update(
+        (name, ids[pitch]) for name, pitch in table.items())
+
+
+def drum_pitch(name) -> str:
+    if not _drum_pitches:
+        _load_drum_pitches()
+    pitch = _drum_pitches.get(name)
+    if pitch is None:
+        pitch = _drum_pitches.get(str(name))
+        if pitch is None:
+            raise ValueError(f"{name!r} is not a drum pitch.")
+    return pitch
+
+
+def drum_pitch_id(name) -> int:
+    if not _drum_pitch_ids:
+        _load_drum_pitches()
+    pitch_id = _drum_pitch_ids.get(name)
+    if pitch_id is None:
+        pitch_id = _drum_pitch_ids.get(str(name))
+        if pitch_id is None:
+            raise ValueError(f"{name!r} is not a drum pitch.")
+    return pitch_id
+
+
+def drum_pitch_name(pitch_id: int) -> str:
+    if not _drum_pitch_names:
+        _load_drum_pitches()
+    return _drum_pitch_names[pitch_id]
+
+
+_written_durations: dict = {}
+
+
+def _written_duration(argument) -> Duration:
+    duration = _written_durations.get(argument)
+    if duration is None:
+        duration = Duration(argument)
+        if not duration.is_assignable:
+            message = f"not assignable duration: {duration!r}."
+            raise abjad.AssignabilityError(message)
+        _written_durations[argument] = duration
+    return duration
+
+
+class DrumComponent(Component):
+
+    def __init__(
+        self,
+        name: str = None,
+        tag: _tag.Tag = None
+    ) -> None:
+        Component.__init__(
+            self,
+            name=name,
+            tag=tag
+        )
+
+    def _get_drum_pitch(self, written_pitch):
+        return drum_pitch(written_pitch)
+
+    def _set_drum_pitch(self, written_pitch):
+        self._written_pitch = drum_pitch(written_pitch)
+
+
+class DrumContainer(DrumComponent, Container):
+    
+    def __init__(
+        self,
+        components=None,
+        identifier: str = None,
+        simultaneous: bool = False,
+        name: str = None,
+        tag: _tag.Tag = None,
+        *arguments,
+        language: str = "english",
+    ) -> None:
+        components = components or []
+        DrumComponent.__init__(self, tag=tag)
+        self._named_children: dict = {}
+        self._is_simultaneous = None
+        # sets name temporarily for _find_correct_effective_context:
+        self._name = name
+        self._initialize_components(components, language=language)
+        self.identifier = identifier
+        self.simultaneous = bool(simultaneous)
+        # sets name permanently after _initalize_components:
+        self.name = name
+
+
+class DrumContext(DrumContainer, Context):
+    
+    def __init__(
+        self,
+        components=None,
+        lilypond_type: str = "Context",
+        simultaneous: bool = False,
+        name: str = None,
+        tag: _tag.Tag = None,
+        *,
+        language: str = "english",
+    ) -> None:
+        self._consists_commands: list[str] = []
+        self._dependent_wrappers: list = []
+        self._remove_commands: list[str] = []
+        self.lilypond_type = lilypond_type
+        DrumContainer.__init__(
+            self,
+            simultaneous=simultaneous,
+            components=components,
+            language=language,
+            name=name,
+            tag=tag,
+        )
+
+
+class DrumMode(DrumContext):
+
+    def __init__(
+        self,
+        components=None,
+        lilypond_type: str = "Voice",
+        simultaneous: bool = False,
+        name: str = None,
+        tag: _tag.Tag = None,
+        *,
+        language: str = "english",
+    ) -> None:
+        DrumContext.__init__(
+            self,
+            components=components,
+            language=language,
+            lilypond_type=lilypond_type,
+            simultaneous=simultaneous,
+            name=name,
+            tag=tag,
+        )
+
+    def _format_open_brackets_site(self, contributions):
+        result = []
+        string = r"\drummode {"
+        result.extend([string])
+        return result
+
+
+class DrumRepeat(DrumContainer):
+
+    def __init__(
+        self,
+        components=None,
+        count: int = 2,
+        repeat_type: str = "unfold",
+        name: str = None,
+        tag: _tag.Tag = None,
+        *,
+        language: str = "english",
+    ) -> None:
+        if repeat_type not in ("unfold", "percent", "volta"):
+            raise ValueError(f"{repeat_type!r} is not a repeat type.")
+        if not isinstance(count, int) or count < 1:
+            raise ValueError(f"{count!r} is not a repeat count.")
+        DrumContainer.__init__(
+            self,
+            components=components,
+            language=language,
+            name=name,
+            tag=tag,
+        )
+        self._count = count
+        self._repeat_type = repeat_type
+
+    def __getnewargs__(self) -> tuple:
+        return [], self.count, self.repeat_type
+
+    def _format_open_brackets_site(self, contributions):
+        result = []
+        string = rf"\repeat {self.repeat_type} {self.count} {{"
+        result.extend([string])
+        return result
+
+    def _get_preprolated_duration(self):
+        return self.count * self._get_contents_duration()
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def repeat_type(self) -> str:
+        return self._repeat_type
+
+    @classmethod
+    def from_pattern(cls, pattern, count: int = 2, repeat_type: str = "unfold"):
+        if isinstance(pattern, DrumGrid):
+            leaves = _grid_leaves(pattern, pattern.pitches)
+        else:
+            leaves = _pattern_leaves(pattern)
+        return cls(leaves, count=count, repeat_type=repeat_type)
+
+
+class DrumVoice(DrumContext):
+
+    _default_lilypond_type = "DrumVoice"
+
+    # TODO: make keywords mandatory
+    def __init__(
+        self,
+        components=None,
+        lilypond_type: str = "DrumVoice",
+        simultaneous: bool = False,
+        name: str = None,
+        tag: _tag.Tag = None,
+        *,
+        language: str = "english",
+    ) -> None:
+        DrumContext.__init__(
+            self,
+            components=components,
+            language=language,
+            lilypond_type=lilypond_type,
+            simultaneous=simultaneous,
+            name=name,
+            tag=tag,
+        )
+        # set by from_grid(): leaf count and cached LilyPond of each measure
+        self._grid_pitches = None
+        self._measure_sizes = None
+        self._measure_strings: list = []
+        self._measure_indent = None
+
+    @classmethod
+    def from_pattern(cls, pattern, name: str = None):
+        if isinstance(pattern, DrumGrid):
+            return cls.from_grid(pattern, name=name)
+        return cls(_pattern_leaves(pattern), name=name)
+
+    @classmethod
+    def from_grid(cls, grid, pitches=None, name: str = None):
+        if pitches is None:
+            pitches = grid.pitches
+        measures = _grid_measures(grid, pitches, range(grid.measures))
+        voice = cls([_ for leaves in measures for _ in leaves], name=name)
+        voice._grid_pitches = tuple(pitches)
+        voice._measure_sizes = [len(_) for _ in measures]
+        return voice
+
+    def mark_dirty(self, *measures) -> None:
+        if not measures:
+            self._measure_strings = []
+        for measure in measures:
+            if measure < len(self._measure_strings):
+                self._measure_strings[measure] = None
+
+    def update_from_grid(self, grid, measures) -> None:
+        if self._measure_sizes is None:
+            raise ValueError(f"{self!r} is not built from a grid.")
+        sizes = self._measure_sizes
+        if grid.measures < len(sizes):
+            del self[sum(sizes[:grid.measures]):]
+            del sizes[grid.measures:]
+            del self._measure_strings[grid.measures:]
+        measures = set(_ for _ in measures if _ < grid.measures)
+        measures.update(range(len(sizes), grid.measures))
+        measures = sorted(measures)
+        new_measures = _grid_measures(grid, self._grid_pitches, measures)
+        for measure, leaves in zip(measures, new_measures):
+            if measure < len(sizes):
+                start = sum(sizes[:measure])
+                first_leaf = self[start]
+                self[start:start + sizes[measure]] = leaves
+                sizes[measure] = len(leaves)
+                if start == 0:
+                    # keeps staff indicators: time signature, voice literals
+                    for wrapper in list(first_leaf._wrappers):
+                        if not _is_grid_indicator(wrapper.indicator):
+                            abjad.detach(wrapper, first_leaf)
+                            abjad.attach(wrapper, leaves[0])
+            else:
+                self.extend(leaves)
+                sizes.append(len(leaves))
+            self.mark_dirty(measure)
+
+    def write_midi(self, path: str, tempo: int = 120) -> None:
+        import drummidi
+        drummidi.write_midi(self, path, tempo=tempo)
+
+
+class DrumStaff(DrumContext):
+
+    _default_lilypond_type = "DrumStaff"
+
+    # TODO: make keywords mandatory
+    def __init__(
+        self,
+        components=None,
+        lilypond_type: str = "DrumStaff",
+        simultaneous: bool = False,
+        name: str = None,
+        tag: _tag.Tag = None,
+        *arguments,
+        language: str = "english",
+    ) -> None:
+        drumVoices = []
+        if isinstance(components, DrumVoice):
+            drumVoices.append(components)
+        elif isinstance(components, list):
+            assert len(components) == 2
+            for component in components:
+                if isinstance(component, DrumVoice):
+                    drumVoices.append(component)
+                else:
+                    raise ValueError(f"{component!r} is not DrumVoice")
+            voiceTwo = abjad.LilyPondLiteral(r"\voiceDOWN")
+            abjad.attach(voiceTwo, drumVoices[1][0])
+        else:
+            raise ValueError(f"{components!r} is not DrumVoice")
+        voiceOne = abjad.LilyPondLiteral(r"\voiceUP")
+        abjad.attach(voiceOne, drumVoices[0][0])
+        container = DrumContainer(
+            drumVoices,
+            simultaneous=simultaneous
+        )
+        dmode = DrumMode(name="drummode")
+        dmode.append(container)
+        DrumContext.__init__(
+            self,
+            components=None,
+            language=language,
+            lilypond_type=lilypond_type,
+            simultaneous=False,
+            name=name,
+            tag=tag,
+        )
+        self.append(dmode)
+
+
+class DrumLeaf(DrumComponent, Leaf):
+
+    def __init__(
+        self,
+        written_duration,
+        *,
+        multiplier=None,
+        tag: _tag.Tag = None
+    ) -> None:
+        DrumComponent.__init__(self, tag=tag)
+        self._after_grace_container = None
+        self._before_grace_container = None
+        self.multiplier = multiplier
+        self.written_duration = written_duration
+
+    @property
+    def written_duration(self) -> Duration:
+        return self._written_duration
+
+    @written_duration.setter
+    def written_duration(self, argument):
+        self._written_duration = _written_duration(argument)
+
+
+class DrumNote(DrumLeaf, Note):
+
+    def __init__(
+        self,
+        *arguments,
+        language: str = "english",
+        multiplier: _typings.DurationTyping = None,
+        tag: _tag.Tag = None,
+    ) -> None:
+        assert len(arguments) in (0, 1, 2)
+        if len(arguments) == 1 and isinstance(arguments[0], str):
+            string = f"{{ {arguments[0]} }}"
+            parsed = self._parse_lilypond_string(string, language=language)
+            assert len(parsed) == 1 and isinstance(parsed[0], DrumLeaf)
+            arguments = tuple([parsed[0]])
+        written_pitch = None
+        is_cautionary = False
+        is_forced = False
+        is_parenthesized = False
+        if len(arguments) == 1 and isinstance(arguments[0], DrumLeaf):
+            leaf = arguments[0]
+            written_pitch = None
+            written_duration = leaf.written_duration
+            if multiplier is None:
+                multiplier = leaf.multiplier
+            if isinstance(leaf, DrumNote) and leaf.note_head is not None:
+                written_pitch = leaf.note_head.written_pitch
+                is_cautionary = leaf.note_head.is_cautionary
+                is_forced = leaf.note_head.is_forced
+                is_parenthesized = leaf.note_head.is_parenthesized
+            # TODO: move into separate from_chord() constructor:
+            elif isinstance(leaf, DrumChord):
+                written_pitches = [_.written_pitch for _ in leaf.note_heads]
+                if written_pitches:
+                    written_pitch = written_pitches[0]
+                    is_cautionary = leaf.note_heads[0].is_cautionary
+                    is_forced = leaf.note_heads[0].is_forced
+                    is_parenthesized = leaf.note_heads[0].is_parenthesized
+        elif len(arguments) == 2:
+            written_pitch, written_duration = arguments
+        elif len(arguments) == 0:
+            written_pitch = self._get_drum_pitch("sn")
+            written_duration = _duration.Duration(1, 4)
+        else:
+            raise ValueError("can not initialize note from {arguments!r}.")
+        DrumLeaf.__init__(self, written_duration, multiplier=multiplier, tag=tag)
+        if isinstance(written_pitch, DrumNoteHead):
+            # shared note-heads copy to themselves
+            self.note_head = copy.copy(written_pitch)
+        elif written_pitch is not None:
+            assert isinstance(written_pitch, str), repr(written_pitch)
+            self.note_head = DrumNoteHead(
+                written_pitch=written_pitch,
+                is_cautionary=is_cautionary,
+                is_forced=is_forced,
+                is_parenthesized=is_parenthesized,
+            )
+        else:
+            self._note_head = None
+        if len(arguments) == 1 and isinstance(arguments[0], DrumLeaf):
+            self._copy_override_and_set_from_leaf(arguments[0])
+
+    def __copy__(self, *arguments):
+        new_note = Leaf.__copy__(self, *arguments)
+        new_note.note_head = copy.copy(self._note_head)
+        return new_note
+
+    def _get_body(self):
+        # abjad's reads note_head; shared note-heads format as they are
+        strings = _format_note_body(self)
+        if strings is None:
+            return Note._get_body(self)
+        return ["\n".join(strings)]
+
+    @property
+    def note_head(self) -> NoteHead:
+        # copy-on-write: a shared note-head is replaced by the note's own
+        # once handed out, so tweaks and flags set on it stay on this note
+        note_head = self._note_head
+        if type(note_head) is _SharedDrumNoteHead:
+            note_head = self._note_head = note_head._unshared()
+        return note_head
+
+    @note_head.setter
+    def note_head(self, argument):
+        Note.note_head.fset(self, argument)
+
+    @property
+    def written_pitch(self):
+        # reading does not need a note-head of its own
+        if self._note_head is not None:
+            return self._note_head.written_pitch
+        return None
+
+    @written_pitch.setter
+    def written_pitch(self, argument):
+        Note.written_pitch.fset(self, argument)
+
+
+class DrumNoteHead(NoteHead):
+
+    def __init__(
+        self,
+        written_pitch: str = "sn",
+        is_cautionary: bool = False,
+        is_forced: bool = False,
+        is_parenthesized: bool = False,
+        tweaks: tweaksmodule.Tweak = None,
+    ) -> None:
+        # NoteHead.__init__() would parse a throwaway NamedPitch
+        self._alternative = None
+        self._written_pitch = drum_pitch(written_pitch)
+        self.is_cautionary = is_cautionary
+        self.is_forced = is_forced
+        self.is_parenthesized = is_parenthesized
+        _tweaks = ()
+        if tweaks is not None:
+            assert all(isinstance(_, tweaksmodule.Tweak) for _ in tweaks)
+            _tweaks = tuple(tweaks)
+        self.tweaks = _tweaks
+
+    def _get_chord_string(self) -> str:
+        result = ""
+        if self.written_pitch:
+            if isinstance(self.written_pitch, str):
+                result = self.written_pitch
+            else:
+                result = self.written_pitch.name
+            if self.is_forced:
+                result += "!"
+            if self.is_cautionary:
+                result += "?"
+        return result
+
+
+class _SharedDrumNoteHead(DrumNoteHead):
+
+    # flyweight: one read-only instance per pitch and flags
+    def __init__(self, *arguments, **keywords) -> None:
+        DrumNoteHead.__init__(self, *arguments, **keywords)
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, "_frozen", False):
+            raise AttributeError(
+                f"shared note-head {self.written_pitch!r} is read-only, "
+                "set a new DrumNoteHead instead.")
+        DrumNoteHead.__setattr__(self, name, value)
+
+    def __copy__(self, *arguments):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def _unshared(self) -> DrumNoteHead:
+        return DrumNoteHead(
+            written_pitch=self.written_pitch,
+            is_cautionary=self.is_cautionary,
+            is_forced=self.is_forced,
+            is_parenthesized=self.is_parenthesized,
+            tweaks=self.tweaks,
+        )
+
+
+_shared_note_heads: dict = {}
+
+
+def shared_note_head(
+    written_pitch: str = "sn",
+    is_cautionary: bool = False,
+    is_forced: bool = False,
+    is_parenthesized: bool = False,
+) -> DrumNoteHead:
+    key = (written_pitch, is_cautionary, is_forced, is_parenthesized)
+    note_head = _shared_note_heads.get(key)
+    if note_head is None:
+        note_head = _SharedDrumNoteHead(
+            written_pitch=written_pitch,
+            is_cautionary=is_cautionary,
+            is_forced=is_forced,
+            is_parenthesized=is_parenthesized,
+        )
+        _shared_note_heads[key] = note_head
+    return note_head
+
+
+def _note_head_key(note_head) -> str:
+    return note_head.written_pitch
+
+
+class DrumNoteHeadList(list):
+
+    def __init__(self, argument=()):
+        note_heads = [self._coerce(_) for _ in argument]
+        list.__init__(self, note_heads)
+        list.sort(self, key=_note_head_key)
+
+    @staticmethod
+    def _coerce(item) -> DrumNoteHead:
+        if isinstance(item, DrumNoteHead):
+            return item
+        return DrumNoteHead(item)
+
+    def _span(self, pitch) -> (int, int):
+        if isinstance(pitch, NoteHead):
+            pitch = pitch.written_pitch
+        else:
+            pitch = drum_pitch(pitch)
+        start = bisect.bisect_left(self, pitch, key=_note_head_key)
+        stop = bisect.bisect_right(self, pitch, start, key=_note_head_key)
+        return start, stop
+
+    def __contains__(self, item) -> bool:
+        try:
+            start, stop = self._span(item)
+        except ValueError:
+            return False
+        return start < stop
+
+    def __setitem__(self, i, argument):
+        if isinstance(i, slice):
+            new_items = [self._coerce(_) for _ in argument]
+            list.__setitem__(self, i, new_items)
+            list.sort(self, key=_note_head_key)
+        else:
+            list.__delitem__(self, i)
+            self.append(argument)
+
+    def append(self, item):
+        note_head = self._coerce(item)
+        bisect.insort_right(self, note_head, key=_note_head_key)
+
+    def extend(self, items) -> None:
+        note_heads = [self._coerce(_) for _ in items]
+        list.extend(self, note_heads)
+        list.sort(self, key=_note_head_key)
+
+    def get(self, pitch) -> DrumNoteHead:
+        start, stop = self._span(pitch)
+        count = stop - start
+        if count == 0:
+            raise ValueError("missing note-head.")
+        elif count == 1:
+            note_head = self[start]
+            return note_head
+        else:
+            raise ValueError("extra note-head.")
+
+    def pop(self, i=-1) -> DrumNoteHead:
+        return list.pop(self, i)
+
+    def remove(self, item):
+        start, stop = self._span(item)
+        if start == stop:
+            raise ValueError("missing note-head.")
+        list.__delitem__(self, start)
+
+
+class DrumChord(DrumLeaf, Chord):
+
+    def __init__(
+        self,
+        *arguments,
+        language: str = "english",
+        multiplier: _typings.DurationTyping = None,
+        tag: _tag.Tag = None,
+    ) -> None:
+        assert len(arguments) in (0, 1, 2)
+        self._note_heads = DrumNoteHeadList()
+        if len(arguments) == 1 and isinstance(arguments[0], str):
+            string = f"{{ {arguments[0]} }}"
+            parsed = self._parse_lilypond_string(string, language=language)
+            assert len(parsed) == 1 and isinstance(parsed[0], DrumLeaf)
+            arguments = tuple([parsed[0]])
+        are_cautionary: list[bool | None] = []
+        are_forced: list[bool | None] = []
+        are_parenthesized: list[bool | None] = []
+        if len(arguments) == 1 and isinstance(arguments[0], DrumLeaf):
+            leaf = arguments[0]
+            written_pitches = []
+            written_duration = leaf.written_duration
+            if multiplier is None:
+                multiplier = leaf.multiplier
+            # TODO: move to dedicated from_note() constructor:
+            if isinstance(leaf, DrumNote) and leaf.note_head is not None:
+                written_pitches.append(leaf.note_head.written_pitch)
+                are_cautionary = [leaf.note_head.is_cautionary]
+                are_forced = [leaf.note_head.is_forced]
+                are_parenthesized = [leaf.note_head.is_parenthesized]
+            elif isinstance(leaf, DrumChord):
+                written_pitches.extend(_.written_pitch for _ in leaf.note_heads)
+                are_cautionary = [_.is_cautionary for _ in leaf.note_heads]
+                are_forced = [_.is_forced for _ in leaf.note_heads]
+                are_parenthesized = [_.is_parenthesized for _ in leaf.note_heads]
+        # TODO: move to dedicated constructor:
+        elif len(arguments) == 2:
+            written_pitches, written_duration = arguments
+            if isinstance(written_pitches, str):
+                written_pitches = [_ for _ in written_pitches.split() if _]
+            elif isinstance(written_pitches, type(self)):
+                written_pitches = written_pitches.written_pitches
+        elif len(arguments) == 0:
+            written_pitches = [self._get_drum_pitch(_) for _ in ["sn", "bd"]]
+            written_duration = _duration.Duration(1, 4)
+        else:
+            raise ValueError(f"can not initialize chord from {arguments!r}.")
+        DrumLeaf.__init__(self, written_duration, multiplier=multiplier, tag=tag)
+        if not are_cautionary:
+            are_cautionary = [None] * len(written_pitches)
+        if not are_forced:
+            are_forced = [None] * len(written_pitches)
+        if not are_parenthesized:
+            are_parenthesized = [None] * len(written_pitches)
+        note_heads = []
+        for written_pitch, is_cautionary, is_forced, is_parenthesized in zip(
+            written_pitches, are_cautionary, are_forced, are_parenthesized
+        ):
+            if not is_cautionary:
+                is_cautionary = False
+            if not is_forced:
+                is_forced = False
+            if not is_parenthesized:
+                is_parenthesized = False
+            if isinstance(written_pitch, DrumNoteHead):
+                note_heads.append(copy.copy(written_pitch))
+                continue
+            assert isinstance(written_pitch, str), repr(written_pitch)
+            note_head = DrumNoteHead(
+                written_pitch=written_pitch,
+                is_cautionary=is_cautionary,
+                is_forced=is_forced,
+                is_parenthesized=is_parenthesized,
+            )
+            note_heads.append(note_head)
+        self._note_heads.extend(note_heads)
+        if len(arguments) == 1 and isinstance(arguments[0], DrumLeaf):
+            self._copy_override_and_set_from_leaf(arguments[0])
+
+    def __copy__(self, *arguments):
+        new_chord = Leaf.__copy__(self, *arguments)
+        new_chord._note_heads[:] = [copy.copy(_) for _ in self._note_heads]
+        return new_chord
+
+    def _format_leaf_nucleus(self):
+        # as DrumNote._get_body
+        strings = _format_chord_body(self)
+        if strings is None:
+            return Chord._format_leaf_nucleus(self)
+        return ["\n".join(strings)]
+
+    @property
+    def note_heads(self) -> DrumNoteHeadList:
+        # copy-on-write, as DrumNote.note_head
+        note_heads = self._note_heads
+        for i, note_head in enumerate(note_heads):
+            if type(note_head) is _SharedDrumNoteHead:
+                list.__setitem__(note_heads, i, note_head._unshared())
+        return note_heads
+
+    @note_heads.setter
+    def note_heads(self, argument):
+        Chord.note_heads.fset(self, argument)
+
+    @property
+    def written_pitches(self) -> tuple:
+        return tuple(_.written_pitch for _ in self._note_heads)
+
+    @written_pitches.setter
+    def written_pitches(self, argument):
+        Chord.written_pitches.fset(self, argument)
+
+    def _get_summary(self):
+        return " ".join([_._get_chord_string() for _ in self._note_heads])
+
+
+class DrumRest(DrumLeaf, Rest):
+
+    def __init__(
+        self,
+        written_duration=None,
+        *,
+        language: str = "english",
+        multiplier: _typings.DurationTyping = None,
+        tag: _tag.Tag = None,
+    ) -> None:
+        if isinstance(written_duration, (str, Leaf)):
+            Rest.__init__(
+                self,
+                written_duration,
+                language=language,
+                multiplier=multiplier,
+                tag=tag,
+            )
+            return
+        if written_duration is None:
+            written_duration = _duration.Duration(1, 4)
+        DrumLeaf.__init__(self, written_duration, multiplier=multiplier, tag=tag)
+
+
+class DrumScore(DrumContext, Score):
+
+    def __init__(
+        self,
+        components=None,
+        lilypond_type: str = "Score",
+        simultaneous: bool = True,
+        name: str = None,
+        tag: _tag.Tag = None,
+        *,
+        language: str = "english",
+    ) -> None:
+        DrumContext.__init__(
+            self,
+            components=None,
+            language=language,
+            lilypond_type=lilypond_type,
+            simultaneous=False,
+            name=name,
+            tag=tag,
+        )
+        if isinstance(components, DrumStaff):
+            self.append(components)
+        elif isinstance(components, list):
+            for component in components:
+                if isinstance(component, DrumStaff):
+                    self.append(component)
+                else:
+                    raise ValueError(f"{component!r} is not DrumStaff")
+        else:
+            raise ValueError(f"{components!r} is not DrumStaff")
+
+    @classmethod
+    def from_grid(
+        cls,
+        grid,
+        name: str = "DrumScore",
+        time_signature: bool = True,
+    ):
+        hands = [_ for _ in grid.pitches if not _is_foot_pitch(_)]
+        feet = [_ for _ in grid.pitches if _is_foot_pitch(_)]
+        voices = []
+        if hands:
+            voices.append(DrumVoice.from_grid(grid, hands, name="Hands"))
+        if feet:
+            voices.append(DrumVoice.from_grid(grid, feet, name="Feet"))
+        if time_signature:
+            indicator = abjad.TimeSignature(grid.time)
+            abjad.attach(indicator, voices[0][0], context="DrumStaff")
+        if len(voices) == 1:
+            voices = voices[0]
+        dstaff = DrumStaff(
+            voices,
+            simultaneous=isinstance(voices, list),
+            name="DrumStaff"
+        )
+        return cls(dstaff, name=name)
+
+    def update_from_grid(self, grid, measures=None) -> None:
+        if measures is None:
+            measures = grid.pop_dirty()
+        for component in _iterate_components(self):
+            if isinstance(component, DrumVoice) \
+                    and component._measure_sizes is not None:
+                component.update_from_grid(grid, measures)
+
+    def write_lilypond(self, fp) -> None:
+        write_lilypond(make_lilypond_file(self), fp)
+
+    def write_midi(self, path: str, tempo: int = 120) -> None:
+        import drummidi
+        drummidi.write_midi(self, path, tempo=tempo)
+
+
+def _pattern_pitch(pitch) -> str:
+    if isinstance(pitch, int):
+        return drum_pitch_name(pitch)
+    return pitch
+
+
+def _pattern_leaves(pattern):
+    leaves = []
+    for pitches, duration in pattern:
+        duration = _written_duration(duration)
+        if isinstance(pitches, (int, str)):
+            pitches = (pitches,)
+        elif pitches is None:
+            pitches = ()
+        note_heads = [shared_note_head(_pattern_pitch(_)) for _ in pitches]
+        if not note_heads:
+            leaves.append(DrumRest(duration))
+        elif len(note_heads) == 1:
+            leaves.append(DrumNote(note_heads[0], duration))
+        else:
+            leaves.append(DrumChord(note_heads, duration))
+    return leaves
+
+
+_foot_pitches = (
+    "bassdrum", "acousticbassdrum", "pedalhihat",
+    "kick", "kicka", "kickb", "kickc", "footpedal",
+)
+
+
+def _is_foot_pitch(pitch) -> bool:
+    return drum_pitch(pitch) in _foot_pitches
+
+
+def _split_steps(steps, unit):
+    durations = []
+    while steps:
+        count = steps
+        while not (unit * count).is_assignable:
+            count = count - 1
+        durations.append(unit * count)
+        steps = steps - count
+    return durations
+
+
+def _grid_leaf(hits, durations):
+    note_heads = [
+        shared_note_head(pitch, is_parenthesized=(value == ord('g')))
+        for pitch, value in hits
+    ]
+    if not note_heads:
+        leaf = DrumRest(durations[0])
+    elif len(note_heads) == 1:
+        leaf = DrumNote(note_heads[0], durations[0])
+    else:
+        leaf = DrumChord(note_heads, durations[0])
+    accent = False
+    sticking = []
+    for pitch, value in hits:
+        hit = chr(value)
+        if hit.isupper():
+            accent = True
+        if hit.lower() == 'r' and r"\rid" not in sticking:
+            sticking.append(r"\rid")
+        elif hit.lower() == 'l' and r"\led" not in sticking:
+            sticking.append(r"\led")
+    if accent:
+        abjad.attach(abjad.Articulation("accent"), leaf)
+    for string in sticking:
+        abjad.attach(abjad.LilyPondLiteral(string, site="after"), leaf)
+    leaves = [leaf]
+    leaves.extend(DrumRest(_) for _ in durations[1:])
+    return leaves
+
+
+def _grid_measure_leaves(grid, rows, unit, measure: int):
+    leaves = []
+    first = measure * grid.measure_steps
+    for beat in range(first, first + grid.measure_steps, grid.beat_steps):
+        beat_end = beat + grid.beat_steps
+        onsets = [
+            step for step in range(beat, beat_end)
+            if any(row[step] != EMPTY for _, row in rows)
+        ]
+        if not onsets or onsets[0] != beat:
+            onsets.insert(0, beat)
+        for start, stop in zip(onsets, onsets[1:] + [beat_end]):
+            hits = [
+                (pitch, row[start]) for pitch, row in rows
+                if row[start] != EMPTY
+            ]
+            leaves.extend(_grid_leaf(hits, _split_steps(stop - start, unit)))
+    return leaves
+
+
+def _grid_measures(grid, pitches, measures):
+    rows = [(pitch, grid.row(pitch)) for pitch in pitches]
+    unit = Duration(1, grid.subdivision)
+    if not unit.is_assignable:
+        raise ValueError(f"can not notate subdivision {grid.subdivision!r}.")
+    return [_grid_measure_leaves(grid, rows, unit, _) for _ in measures]
+
+
+def _grid_leaves(grid, pitches):
+    leaves = []
+    for measure in _grid_measures(grid, pitches, range(grid.measures)):
+        leaves.extend(measure)
+    return leaves
+
+
+def _is_grid_indicator(indicator) -> bool:
+    if isinstance(indicator, abjad.Articulation):
+        return True
+    return isinstance(indicator, abjad.LilyPondLiteral) \
+        and indicator.site == "after" \
+        and indicator.argument in (r"\rid", r"\led")
+
+
+_indent = "    "
+_duration_strings: dict = {}
+
+
+def _format_duration(leaf) -> str:
+    duration = leaf.written_duration
+    string = _duration_strings.get(duration)
+    if string is None:
+        string = duration.lilypond_duration_string
+        _duration_strings[duration] = string
+    if leaf.multiplier is not None:
+        string = f"{string} * {leaf.multiplier}"
+    return string
+
+
+def _format_note_head(note_head):
+    if note_head.tweaks or note_head.alternative:
+        return None
+    if not isinstance(note_head.written_pitch, str):
+        return None
+    kernel = note_head.written_pitch
+    if note_head.is_forced:
+        kernel += "!"
+    if note_head.is_cautionary:
+        kernel += "?"
+    if note_head.is_parenthesized:
+        return [r"\parenthesize", kernel]
+    return [kernel]
+
+
+def _has_overrides(component) -> bool:
+    # abjad leaves empty interfaces behind once it has formatted a component
+    for interface in (
+        component._overrides,
+        component._lilypond_setting_name_manager,
+    ):
+        if interface is not None and vars(interface):
+            return True
+    return False
+
+
+_literal_sites = ("before", "opening", "closing", "after")
+
+
+def _format_indicators(leaf):
+    # accents and literals, as attached by the grid builder; other
+    # indicators are formatted by abjad
+    sites: dict = {_: [] for _ in _literal_sites}
+    articulations = []
+    for wrapper in leaf._wrappers:
+        if wrapper.tag.string or wrapper.deactivate or wrapper.annotation:
+            return None
+        if wrapper.context is not None or wrapper.direction is not None:
+            return None
+        indicator = wrapper.indicator
+        if type(indicator) is abjad.Articulation and indicator.name:
+            name = indicator._shortcut_to_word.get(indicator.name)
+            articulations.append(rf"- \{name or indicator.name}")
+        elif type(indicator) is abjad.LilyPondLiteral \
+                and indicator.site in sites:
+            if isinstance(indicator.argument, str):
+                sites[indicator.site].append(indicator.argument)
+            else:
+                sites[indicator.site].extend(indicator.argument)
+        else:
+            return None
+    before = sites["before"] + sites["opening"]
+    after = sites["closing"] + articulations + sites["after"]
+    return before, after
+
+
+def _format_leaf(leaf):
+    if leaf.tag is not None:
+        return None
+    if leaf._wrappers:
+        indicators = _format_indicators(leaf)
+        if indicators is None:
+            return None
+        strings = _format_leaf_body(leaf)
+        if strings is None:
+            return None
+        before, after = indicators
+        return before + strings + after
+    return _format_leaf_body(leaf)
+
+
+def _format_leaf_body(leaf):
+    if _has_overrides(leaf):
+        return None
+    if leaf._before_grace_container is not None \
+            or leaf._after_grace_container is not None:
+        return None
+    leaf_type = type(leaf)
+    if leaf_type in (DrumRest, abjad.Rest):
+        return [f"r{_format_duration(leaf)}"]
+    if leaf_type in (DrumNote, Note):
+        return _format_note_body(leaf)
+    if leaf_type in (DrumChord, Chord):
+        return _format_chord_body(leaf)
+    return None
+
+
+# the private attributes: the public ones unshare note-heads
+def _format_note_body(leaf):
+    if leaf._note_head is None:
+        return [_format_duration(leaf)]
+    strings = _format_note_head(leaf._note_head)
+    if strings is None:
+        return None
+    strings[-1] += _format_duration(leaf)
+    return strings
+
+
+def _format_chord_body(leaf):
+    note_heads = [_format_note_head(_) for _ in leaf._note_heads]
+    if None in note_heads:
+        return None
+    duration = _format_duration(leaf)
+    if any(len(_) > 1 for _ in note_heads):
+        strings = ["<"]
+        for note_head in note_heads:
+            strings.extend(_indent + _ for _ in note_head)
+        strings.append(">" + duration)
+        return strings
+    pitches = " ".join(_[0] for _ in note_heads)
+    return [f"<{pitches}>{duration}"]
+
+
+def _format_brackets(container):
+    if container._wrappers or container.tag is not None:
+        return None
+    if _has_overrides(container):
+        return None
+    if container.identifier:
+        return None
+    container_type = type(container)
+    if container.simultaneous:
+        open_bracket, close_bracket = "<<", ">>"
+    else:
+        open_bracket, close_bracket = "{", "}"
+    if container_type is DrumMode:
+        return [r"\drummode {"], close_bracket
+    if container_type is DrumContainer:
+        return [open_bracket], close_bracket
+    if container_type is DrumRepeat:
+        string = rf"\repeat {container.repeat_type} {container.count} {{"
+        return [string], "}"
+    if container_type in (DrumScore, DrumStaff, DrumVoice, DrumContext):
+        if container.consists_commands or container.remove_commands:
+            return None
+        if container.name is not None:
+            invocation = rf'\context {container.lilypond_type} = "{container.name}"'
+        else:
+            invocation = rf"\new {container.lilypond_type}"
+        return [invocation, open_bracket], close_bracket
+    return None
+
+
+def _iterate_components(component):
+    yield component
+    if isinstance(component, Container):
+        for child in component._components:
+            yield from _iterate_components(child)
+    elif isinstance(component, Leaf):
+        for container in (
+            component._before_grace_container,
+            component._after_grace_container,
+        ):
+            if container is not None:
+                yield from _iterate_components(container)
+
+
+def _update_indicators(component):
+    # same as abjad's indicator update, without its costly score iteration
+    parentage = component._get_parentage()
+    if any(_._is_forbidden_to_update for _ in parentage):
+        return
+    root = parentage[-1]
+    if root._indicators_are_current:
+        return
+    for component in _iterate_components(root):
+        for wrapper in component._wrappers:
+            if wrapper.context is not None and not wrapper.annotation:
+                wrapper._update_effective_context()
+        component._indicators_are_current = True
+
+
+_drum_containers = (
+    DrumScore, DrumStaff, DrumMode, DrumVoice, DrumContext, DrumContainer,
+    DrumRepeat,
+)
+
+
+def _indent_strings(strings, indent: str) -> list:
+    result = []
+    for string in strings:
+        string = indent + string
+        result.append("" if string.isspace() else string)
+    return result
+
+
+def _component_duration(component):
+    if isinstance(component, Leaf) and component.multiplier is None:
+        return component.written_duration
+    return component._get_preprolated_duration()
+
+
+def _lilypond_chunks(argument, indent: str = "", measure=None):
+    # yields lists of lines: one per measure inside voices
+    if measure is None:
+        measure = [Duration(1)]
+    strings = None
+    if isinstance(argument, Leaf):
+        strings = _format_leaf(argument)
+    elif isinstance(argument, Container):
+        brackets = _format_brackets(argument)
+        if brackets is not None:
+            open_brackets, close_bracket = brackets
+            yield [indent + _ for _ in open_brackets]
+            yield from _lilypond_contents(argument, indent + _indent, measure)
+            yield [indent + close_bracket]
+            return
+    if strings is None:
+        strings = abjad.lilypond(argument).split("\n")
+    yield _indent_strings(strings, indent)
+
+
+def _is_measure_cached(container) -> bool:
+    if type(container) is not DrumVoice or container._measure_sizes is None:
+        return False
+    if sum(container._measure_sizes) != len(container):
+        # edited outside update_from_grid(): measures are unknown
+        container._measure_sizes = None
+        return False
+    return True
+
+
+def _measure_state(leaves):
+    # what the LilyPond of a measure depends on, compared on each format so
+    # that replaced leaves, attached indicators and in-place edits are seen
+    objects, values = [], []
+    for leaf in leaves:
+        if not isinstance(leaf, Leaf) or _has_overrides(leaf):
+            return None
+        note_heads = getattr(leaf, "_note_heads", None)
+        if note_heads is None:
+            note_head = getattr(leaf, "_note_head", None)
+            note_heads = () if note_head is None else (note_head,)
+        for note_head in note_heads:
+            # a mutable note-head can change without notice
+            if type(note_head) is not _SharedDrumNoteHead:
+                return None
+        objects.append(leaf)
+        objects.extend(note_heads)
+        for wrapper in leaf._wrappers:
+            objects.append(wrapper)
+            objects.append(wrapper.indicator)
+        values.append((
+            len(objects), leaf.written_duration, leaf.multiplier, leaf.tag))
+    return objects, values
+
+
+def _same_state(old, new) -> bool:
+    if old is None or new is None or len(old[0]) != len(new[0]):
+        return False
+    return old[1] == new[1] and all(map(operator.is_, old[0], new[0]))
+
+
+def _cached_measure_chunks(voice, indent: str):
+    sizes = voice._measure_sizes
+    cache = voice._measure_strings
+    if voice._measure_indent != indent:
+        cache[:] = []
+        voice._measure_indent = indent
+    del cache[len(sizes):]
+    cache.extend([None] * (len(sizes) - len(cache)))
+    start = 0
+    for i, size in enumerate(sizes):
+        leaves = voice[start:start + size]
+        state = _measure_state(leaves)
+        if cache[i] is None or not _same_state(cache[i][0], state):
+            strings = []
+            for leaf in leaves:
+                for chunk in _lilypond_chunks(leaf, indent):
+                    strings.extend(chunk)
+            cache[i] = (state, strings)
+        yield cache[i][1]
+        start = start + size
+
+
+def _lilypond_contents(container, indent: str, measure):
+    if _is_measure_cached(container):
+        yield from _cached_measure_chunks(container, indent)
+        return
+    chunk = []
+    elapsed = 0
+    for component in container:
+        if type(component) in _drum_containers:
+            if chunk:
+                yield chunk
+                chunk, elapsed = [], 0
+            yield from _lilypond_chunks(component, indent, measure)
+            continue
+        for wrapper in component._wrappers:
+            if isinstance(wrapper.indicator, abjad.TimeSignature):
+                measure[0] = wrapper.indicator.duration
+        for strings in _lilypond_chunks(component, indent, measure):
+            chunk.extend(strings)
+        elapsed = elapsed + _component_duration(component)
+        if measure[0] <= elapsed:
+            while measure[0] <= elapsed:
+                elapsed = elapsed - measure[0]
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _lilypond_file_chunks(lilypond_file):
+    items = lilypond_file.items
+    if lilypond_file.tag is not None \
+            or not all(isinstance(_, (str, Component)) for _ in items):
+        yield abjad.lilypond(lilypond_file).split("\n")
+        return
+    strings = []
+    token = lilypond_file.lilypond_version_token
+    if token is True:
+        version = _configuration.configuration.get_lilypond_version_string()
+        strings.append(rf'\version "{version}"')
+    elif isinstance(token, str):
+        strings.append(token)
+    if lilypond_file.lilypond_language_token is True:
+        strings.append(r'\language "english"')
+    if strings:
+        yield strings
+    for item in items:
+        if isinstance(item, str):
+            strings = _tag.remove_tags(item).split("\n")
+            yield _indent_strings(strings, "")
+        else:
+            _update_indicators(item)
+            for strings in _lilypond_chunks(item):
+                yield _indent_strings(strings, "")
+
+
+def _chunks(argument):
+    if isinstance(argument, abjad.LilyPondFile):
+        return _lilypond_file_chunks(argument)
+    if isinstance(argument, Component):
+        _update_indicators(argument)
+    return _lilypond_chunks(argument)
+
+
+def lilypond(argument) -> str:
+    return "\n".join(
+        string for strings in _chunks(argument) for string in strings
+    )
+
+
+def iterate_lilypond(argument):
+    for strings in _chunks(argument):
+        yield "\n".join(strings) + "\n"
+
+
+def write_lilypond(argument, fp) -> None:
+    for chunk in iterate_lilypond(argument):
+        fp.write(chunk)
+
+
+def make_lilypond_file(
+    dscore: DrumScore,
+    include: bool = False,
+) -> abjad.LilyPondFile:
+    resources = layout_resources()
+    if include:
+        items = resources.includes()
+    else:
+        items = resources.texts()
+    items.append(dscore)
+    return abjad.LilyPondFile(items)
+
+
+def write_lilypond_file(dscore: DrumScore, path: str) -> None:
+    with open(path, "w") as ly_file:
+        dscore.write_lilypond(ly_file)
+
+
+def _system_chunks(dscore, indent: str):
+    # the voices of a from_grid() score, without its enclosing contexts
+    _update_indicators(dscore)
+    for container in dscore[0][0]:
+        yield from _lilypond_chunks(container, indent)
+
+
+def iterate_lilypond_systems(grids, include: bool = False):
+    # grids may be lazy: only one system is built and held at a time
+    closing = []
+    indent = ""
+    for i, grid in enumerate(grids):
+        dscore = DrumScore.from_grid(grid, time_signature=(i == 0))
+        if i == 0:
+            lilypond_file = make_lilypond_file(dscore, include=include)
+            lilypond_file.items.remove(dscore)
+            for strings in _lilypond_file_chunks(lilypond_file):
+                yield "\n".join(strings) + "\n"
+            for container in (dscore, dscore[0], dscore[0][0]):
+                open_brackets, close_bracket = _format_brackets(container)
+                yield "\n".join(indent + _ for _ in open_brackets) + "\n"
+                closing.insert(0, indent + close_bracket)
+                indent = indent + _indent
+        for strings in _system_chunks(dscore, indent):
+            yield "\n".join(strings) + "\n"
+    if closing:
+        yield "\n".join(closing) + "\n"
@@ -0,0 +1,121 @@
+import re
+from drumgrid import DrumGrid, EMPTY
+
+
+# "  ride|o---o---|" rows as drawn by drumpond_nc.DrumTab, and its
+# "     |1•••2•••|" beat footer
+_row_re = re.compile(r"^\s*([A-Za-z][\w]*)\s*\|(.*?)\s*$")
+_footer_re = re.compile(r"^\s*\|(.*?)\s*$")
+
+
+class TabSystem():
+
+    def __init__(self, line_number: int) -> None:
+        self.line_number = line_number
+        self.rows: dict = {}
+        self.beats = None
+
+
+def read_systems(lines):
+    # yields one TabSystem per row of the tab, reading lines lazily
+    system = None
+    for line_number, line in enumerate(lines, 1):
+        match = _row_re.match(line)
+        if match is not None:
+            pitch, row = match.groups()
+            if system is not None and pitch in system.rows:
+                yield system
+                system = None
+            if system is None:
+                system = TabSystem(line_number)
+            system.rows[pitch] = row
+            continue
+        match = _footer_re.match(line)
+        if match is not None and system is not None:
+            measure = match.group(1).split("|")[0]
+            system.beats = sum(_.isdigit() for _ in measure) or None
+        if system is not None:
+            yield system
+            system = None
+    if system is not None:
+        yield system
+
+
+def tab_rows(lines) -> dict:
+    # {pitch: hits} of a whole tab, systems joined end to end and rows
+    # missing from a system left empty
+    empty = chr(EMPTY)
+    rows: dict = {}
+    steps = 0
+    for system in read_systems(lines):
+        width = 0
+        for pitch, row in system.rows.items():
+            row = row.replace("|", "")
+            rows[pitch] = rows.get(pitch, "").ljust(steps, empty) + row
+            width = max(width, len(row))
+        steps = steps + width
+    return {pitch: row.ljust(steps, empty) for pitch, row in rows.items()}
+
+
+def _measure_steps(system) -> int:
+    row = next(iter(system.rows.values()))
+    return len(row.split("|")[0])
+
+
+def _check_pitch(pitch: str, line_number: int) -> None:
+    from drumscore import drum_pitch
+    try:
+        drum_pitch(pitch)
+    except ValueError as error:
+        raise ValueError(f"line {line_number}: {error}") from None
+
+
+def tab_grids(lines, time: (int, int) = None, subdivision: int = None):
+    # yields one DrumGrid per system; pitches accumulate across systems so
+    # every system keeps the same voices
+    pitches: list = []
+    for system in read_systems(lines):
+        steps = _measure_steps(system)
+        if time is None:
+            beats = system.beats or 4
+            time = (beats, 4)
+        if subdivision is None:
+            beats, division = time
+            if not steps or steps * division % beats:
+                raise ValueError(
+                    "line {}: can not fit {} steps in {}/{}".format(
+                        system.line_number, steps, beats, division))
+            subdivision = steps * division // beats
+        for pitch in system.rows:
+            if pitch not in pitches:
+                _check_pitch(pitch, system.line_number)
+                pitches.append(pitch)
+        rows = {pitch: system.rows.get(pitch, "") for pitch in pitches}
+        try:
+            grid = DrumGrid.from_rows(rows, time=time, subdivision=subdivision)
+        except ValueError as error:
+            raise ValueError(f"line {system.line_number}: {error}") from None
+        yield grid
+
+
+def tab2ly(lines, fp, time=None, subdivision=None, include=False) -> None:
+    import drumscore
+    grids = tab_grids(lines, time=time, subdivision=subdivision)
+    for chunk in drumscore.iterate_lilypond_systems(grids, include=include):
+        fp.write(chunk)
+
+
+def read_grid(lines, time=None, subdivision=None) -> DrumGrid:
+    # the whole tab as one grid, systems joined end to end
+    grids = list(tab_grids(lines, time=time, subdivision=subdivision))
+    if not grids:
+        return DrumGrid(measures=0)
+    rows = {}
+    for pitch in grids[-1].pitches:
+        rows[pitch] = b"".join(
+            bytes(grid.row(pitch)) if pitch in grid.pitches
+            else bytes([EMPTY]) * grid.steps
+            for grid in grids
+        )
+    return DrumGrid.from_rows(
+        rows, time=grids[0].time, subdivision=grids[0].subdivision)
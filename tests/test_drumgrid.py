@@ -0,0 +1,27 @@
+import drumscore
+from drumgrid import DEFAULT_PITCHES, DrumGrid, GridHistory
+from drumlayout import layout_resources
+
+
+def test_default_pitches_are_in_drumkit():
+    # drumkit.ly's drumPitchNames replaces LilyPond's: names missing from
+    # it fail to engrave with the project's layout
+    drumkit = layout_resources().text("drumkit.ly")
+    names = drumscore._read_drumkit_aliases(drumkit)
+    for pitch in DEFAULT_PITCHES:
+        assert pitch in names
+        assert drumscore.drum_pitch(pitch) in names
+
+
+def test_undo_shrinks_a_grown_grid():
+    # an undone repeat past the end leaves no empty measures to write
+    grid = DrumGrid(measures=1)
+    history = GridHistory(grid)
+    history.set("sn", 0, ord("x"))
+    history.repeat(["sn"], 0, grid.measure_steps, 3)
+    assert grid.measures == 4
+    history.undo()
+    assert grid.measures == 1
+    assert all(_ < 1 for _ in grid.dirty)
+    history.redo()
+    assert grid.measures == 4
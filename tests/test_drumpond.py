@@ -0,0 +1,23 @@
+import os
+import subprocess
+import sys
+
+import drumpond
+
+
+def test_import_is_within_budget():
+    assert drumpond.import_time() <= drumpond.IMPORT_BUDGET
+
+
+def test_import_does_not_load_the_score_model():
+    # in a fresh interpreter: this one may have loaded abjad already
+    code = "import sys, drumpond; " \
+        "print(sorted({'abjad', 'drumscore'} & set(sys.modules)))"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(drumpond.__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,67 @@
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import drumrender
+
+
+# answers "ready", then never replies to a job
+_hang_command = [
+    sys.executable, "-c",
+    "import time; print('drumpond: ready', flush=True); time.sleep(60)",
+]
+
+
+def _ly_file(tmp_path, text: str = r"{ c'4 }"):
+    path = tmp_path / "score.ly"
+    path.write_text(text)
+    return path
+
+
+def test_fake_server_engraves(tmp_path):
+    server = drumrender.LilyPondServer(drumrender.fake_server_command())
+    try:
+        output = server.engrave(str(_ly_file(tmp_path)), timeout=10)
+    finally:
+        server.close()
+    assert output == str(tmp_path / "score.pdf")
+    assert (tmp_path / "score.pdf").read_text() == r"{ c'4 }"
+
+
+def test_fake_server_reports_errors(tmp_path):
+    server = drumrender.LilyPondServer(drumrender.fake_server_command())
+    try:
+        with pytest.raises(RuntimeError, match="ly-file-failed"):
+            server.engrave(str(_ly_file(tmp_path, "BROKEN")), timeout=10)
+        # the server is still usable after a failed job
+        server.engrave(str(_ly_file(tmp_path)), timeout=10)
+    finally:
+        server.close()
+
+
+def test_hanging_server_times_out(tmp_path):
+    server = drumrender.LilyPondServer(_hang_command)
+    with pytest.raises(subprocess.TimeoutExpired):
+        server.engrave(str(_ly_file(tmp_path)), timeout=0.5)
+    assert not server.alive
+
+
+def test_pool_replaces_dead_server(tmp_path):
+    ly_path = str(_ly_file(tmp_path))
+    with drumrender.LilyPondPool(
+            1, command=drumrender.fake_server_command()) as pool:
+        pool.engrave(ly_path, timeout=10)
+        server, = pool._servers
+        server._process.kill()
+        server._process.wait()
+        pool.engrave(ly_path, timeout=10)
+        replacement, = pool._servers
+    assert replacement is not server
+
+
+@pytest.mark.skipif(
+    shutil.which("lilypond") is None, reason="lilypond is not installed")
+def test_lilypond_server():
+    drumrender.check_server()
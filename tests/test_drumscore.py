@@ -0,0 +1,19 @@
+import abjad
+
+import drumscore
+from drumgrid import DrumGrid
+
+
+def test_grid_leaves_can_be_tweaked():
+    # leaves built from a grid share note-heads until one is handed out
+    grid = DrumGrid.from_rows({"sn": "x---x---", "bd": "o-------"})
+    voice = drumscore.DrumVoice.from_grid(grid)
+    chord, note = list(abjad.iterate.leaves(voice))[:2]
+    abjad.tweak(chord.note_heads[0], r"\tweak color #red")
+    note.note_head.is_forced = True
+    string = drumscore.lilypond(voice)
+    assert r"\tweak color #red" in string
+    assert "snare!" in string
+    assert string == abjad.lilypond(voice)
+    assert not drumscore.shared_note_head("sn").is_forced
+    assert not drumscore.shared_note_head("bd").tweaks